@@ -5,9 +5,13 @@ Created on Sun Aug 23 16:39:45 2020
 
 @author: travis
 """
+import json
+
 import dash
 
+from review.caching import Source_Registry, prometheus
 from review.support import STYLESHEET
+from flask import request, Response
 from flask_caching import Cache
 
 app = dash.Dash(__name__,
@@ -15,21 +19,56 @@ app = dash.Dash(__name__,
                 external_stylesheets=[STYLESHEET])
 server = app.server
 
+# Data frames in these caches are stored as Arrow files rather than pickles.
+# The full tables are uncompressed, so every worker memory-maps them and
+# shares them through the page cache. The filtered tables are read less
+# often and are mostly small, so they're LZ4 compressed to save disk instead.
+# Frames read from them are read-only (see review.caching)
+POOL = "review.caching.TablePool"
+GB = 1024 ** 3
+
+# Each worker keeps up to CACHE_MEMORY_LIMIT bytes of live entries from a
+# cache, and the cache's folder is pruned to CACHE_DISK_LIMIT bytes
+
 # Create simple cache for storing updated supply curve tables
-cache = Cache(config={"CACHE_TYPE": "filesystem",
+cache = Cache(config={"CACHE_TYPE": POOL,
                       "CACHE_DIR": "data/cache",
-                      "CACHE_THRESHOLD": 10})
+                      "CACHE_THRESHOLD": 0,
+                      "CACHE_MEMORY_LIMIT": 2 * GB,
+                      "CACHE_DISK_LIMIT": 20 * GB,
+                      "CACHE_TABLE_FORMAT": "arrow"})
 
 # Create another cache for storing filtered supply curve tables
-cache2 = Cache(config={"CACHE_TYPE": "filesystem",
+cache2 = Cache(config={"CACHE_TYPE": POOL,
                        "CACHE_DIR": "data/cache2",
-                       "CACHE_THRESHOLD": 10})
+                       "CACHE_THRESHOLD": 0,
+                       "CACHE_MEMORY_LIMIT": 1 * GB,
+                       "CACHE_DISK_LIMIT": 10 * GB,
+                       "CACHE_TABLE_FORMAT": "arrow_lz4"})
 
 # Create another cache for storing filtered supply curve tables
-cache3 = Cache(config={"CACHE_TYPE": "filesystem",
+cache3 = Cache(config={"CACHE_TYPE": POOL,
                        "CACHE_DIR": "data/cache3",
-                       "CACHE_THRESHOLD": 10})
+                       "CACHE_THRESHOLD": 0,
+                       "CACHE_MEMORY_LIMIT": 1 * GB,
+                       "CACHE_DISK_LIMIT": 10 * GB,
+                       "CACHE_TABLE_FORMAT": "arrow_lz4"})
 
 cache.init_app(server)
 cache2.init_app(server)
 cache3.init_app(server)
+
+# Cache entries are registered against the supply-curve files they're built
+# from, so rewriting a file invalidates everything built from it
+CACHES = {"cache": cache, "cache2": cache2, "cache3": cache3}
+sources = Source_Registry("data/sources", CACHES)
+
+
+@server.route("/_review/metrics")
+def cache_metrics():
+    """Return this worker's cache metrics as JSON or Prometheus text."""
+    metrics = {name: c.cache.stats() for name, c in CACHES.items()
+               if hasattr(c.cache, "stats")}
+    if request.args.get("format") == "prometheus":
+        return Response(prometheus(metrics), mimetype="text/plain")
+    return Response(json.dumps(metrics), mimetype="application/json")
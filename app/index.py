@@ -15,10 +15,11 @@ from dash.dependencies import Input, Output
 import scenario_page, config_page
 
 from app import app, server
-from innovations_presentation import innovation_layouts
+from innovations_presentation import innovation_defaults, innovation_layouts
 from navbar import NAVBAR
 from review.support import Config
 from review.support import BUTTON_STYLES
+from warmer import Warmer
 
 print("FLASK SERVER SETTINGS: \n   " + str(dict(server.config)))
 
@@ -37,10 +38,16 @@ PAGES = {
 }
 
 # Make sure transition is configured correctly
+DEFAULTS = [scenario_page.DEFAULTS]
 if "Transition" in Config().projects:
     TCONFIG = Config("Transition")
     if os.path.exists(TCONFIG.data["file"].iloc[0]):
         PAGES = {**PAGES, **innovation_layouts()}
+        DEFAULTS += list(innovation_defaults().values())
+
+# Load the default and most popular tables into the caches in the background
+WARMER = Warmer(server, defaults=DEFAULTS)
+WARMER.start()
 
 
 @app.callback([Output("page_content", "children"),
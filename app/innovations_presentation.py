@@ -13,8 +13,8 @@ from layouts import scenario_layout
 
 
 # Default object for initial layout
-def innovation_layouts():
-    """Build a list of layouts for our innovation presenation slides."""
+def innovation_defaults():
+    """Build the default objects for our innovation presentation slides."""
     # 1 - Most Baseline Turbine  
     defaults1 = Defaults(
         project="Transition",
@@ -41,15 +41,15 @@ def innovation_layouts():
 
     # 7 - Lower FCR
 
-    layout1 = scenario_layout(defaults1)
-    layout2 = scenario_layout(defaults2)
-    layout3 = scenario_layout(defaults3)
-
-    layouts = {
-        "/innovations_one": layout1,
-        "/innovations_two": layout2,
-        "/innovations_three": layout3,
-
+    return {
+        "/innovations_one": defaults1,
+        "/innovations_two": defaults2,
+        "/innovations_three": defaults3,
     }
 
+
+def innovation_layouts():
+    """Build a list of layouts for our innovation presenation slides."""
+    defaults = innovation_defaults()
+    layouts = {page: scenario_layout(d) for page, d in defaults.items()}
     return layouts
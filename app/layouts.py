@@ -358,6 +358,14 @@ def scenario_layout(defaults):
                         ),
                     ]),
 
+                    # Least cost progress, checked while calculating
+                    html.Div(id="low_cost_progress"),
+                    dcc.Interval(
+                        id="low_cost_interval",
+                        interval=1000,
+                        disabled=True
+                    ),
+
                     html.Hr(),
                 ], className="four columns"),
 
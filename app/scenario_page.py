@@ -11,6 +11,7 @@ Things to do:
 import copy
 import json
 import os
+import threading
 
 import dash
 import dash_core_components as dcc
@@ -19,26 +20,80 @@ import numpy as np
 import pandas as pd
 import plotly.express as px
 
-from app import app, cache, cache2, cache3
+from app import app, cache, cache2, cache3, sources
 from dash.dependencies import Input, Output, State
 from dash.exceptions import PreventUpdate
 
 from layouts import scenario_layout, RC_STYLES
 from review import print_args
+from review.caching import single_flight
+from review.columnar import fingerprint_key
 from review.support import (AGGREGATIONS, BUTTON_STYLES, COLOR_OPTIONS,
                             COLOR_Q_OPTIONS, COLORS, COLORS_Q, DEFAULT_MAPVIEW,
-                            MAP_LAYOUT, TABLET_STYLE)
+                            MAP_LAYOUT, TABLET_STYLE, TITLES)
 from review.support import (Categories, Config, Data, Data_Path, Defaults,
-                            Difference, Least_Cost, Plots, point_filter, wmean)
+                            Difference, Filter_Pipeline, Least_Cost, Plots,
+                            is_number, threshold_index, wmean)
+from warmer import record_signal
 
 
 # Default object for initial layout
+_PIPELINES = {}
+_PIPELINES_LOCK = threading.Lock()
+ALL_LEVELS = "__all_levels__"
+PIPELINE_LIMIT = 8
 PROJECT = "Transition"
 DEFAULTS = Defaults(project=PROJECT)
 layout = scenario_layout(DEFAULTS)
 
 
 # More Support functions  <--------------------------------------------------- Move to module
+def build_hover_text(df, y, units):
+    """Build the map hover text for each point.
+
+    The location part of each label is kept with the table (see
+    build_locations), so only the values are formatted here, and each unique
+    value is formatted once.
+    """
+    if "location" in df.columns:
+        locations = df["location"].to_numpy(dtype=object)
+    else:
+        locations = build_locations(df).to_numpy(dtype=object)
+
+    values = df[y]
+    if units != "category":
+        values = values.round(2)
+
+    # Missing values are coded -1, which points to the last label
+    codes, uniques = pd.factorize(values)
+    labels = np.array([str(u) for u in uniques] + ["nan"], dtype=object)
+    text = locations + labels[codes] + f" {units}"
+
+    return pd.Series(text, index=df.index)
+
+
+def build_locations(df):
+    """Build the location part of the map hover text for each point.
+
+    Onshore points are labeled with their county and state, and offshore
+    points, which have neither, with their coordinates.
+    """
+    county = df["county"]
+    state = df["state"]
+    onshore = (county.notnull() & state.notnull()).to_numpy()
+    offshore = ~onshore
+
+    locations = np.empty(len(df), dtype=object)
+    locations[onshore] = (county[onshore] + " County, "
+                          + state[onshore]).to_numpy(dtype=object)
+    if offshore.any():
+        lat = df["latitude"][offshore].round(2).map(str)
+        lon = df["longitude"][offshore].round(2).map(str)
+        locations[offshore] = (lat + ", " + lon).to_numpy(dtype=object)
+
+    return pd.Series(locations + ": <br>   ", index=df.index)
+
+
 def build_map_layout(mapview, title, basemap, showlegend, ymin, ymax,
                      title_size=18):
     """Build the map data layout dictionary."""
@@ -103,14 +158,7 @@ class Scatter():
     @property
     def hover_text(self):
         """Return hovertext for points."""
-        text = self.df["county"] + " County, " + self.df["state"] + ": <br>   "
-        if self.units == "category":
-            text = text + self.df[self.y].astype(str) + " " + self.units
-        else:
-            text = (text + self.df[self.y].round(2).astype(str) + " "
-                    + self.units)
-
-        return text
+        return build_hover_text(self.df, self.y, self.units)
 
     @property
     def units(self):
@@ -133,28 +181,7 @@ def build_scatter(df, y, x, units, color, rev_color, ymin, ymax, point_size,
     plot object and manually reverse scales.
     """
     # Create hover text
-    if units == "category":
-        df["text"] = (df["county"] + " County, " + df["state"] + ": <br>   "
-                      + df[y].astype(str) + " " + units)
-    else:
-        df["text"] = (df["county"] + " County, " + df["state"] + ": <br>   "
-                      + df[y].round(2).astype(str) + " " + units)
-
-    # Offshore points will be nans since they don't have states or counties
-    if any(df["text"].isnull()):
-        ondf = df[~pd.isnull(df["text"])]
-        offdf = df[pd.isnull(df["text"])]
-        if units == "category":
-            offdf["text"] = (offdf["latitude"].round(2).astype(str) + ", "
-                             + offdf["longitude"].round(2).astype(str)
-                             + ": <br>   "
-                             + offdf[y].astype(str) + " " + units)
-        else:
-            offdf["text"] = (offdf["latitude"].round(2).astype(str) + ", "
-                             + offdf["longitude"].round(2).astype(str)
-                             + ": <br>   "
-                             + offdf[y].round(2).astype(str) + " " + units)
-        df = pd.concat([ondf, offdf])
+    df["text"] = build_hover_text(df, y, units)
 
     # Categorical data will be made of multiple traces
     if units == "category":
@@ -222,6 +249,76 @@ def build_scatter(df, y, x, units, color, rev_color, ymin, ymax, point_size,
     return figure
 
 
+def build_signal(states, chart, x, scenarios, recalc_table, project,
+                 threshold, threshold_field, path, path2, y, diff, mask,
+                 recalc, diff_units):
+    """Build the map and chart signal from the values of the page's options.
+
+    The arguments are the values of the inputs and states of retrieve_signal,
+    so the signal of a page's initial layout can be built without a request
+    (e.g. to warm the caches).
+    """
+    # Get/build the value scale table
+    config = Config(project)
+    scales = config.project_config["scales"]
+
+    # Get the full path from the config
+    pdir = config.directory
+    path = os.path.join(pdir, path)
+    if path2:
+        path2 = os.path.join(pdir, path2)
+    if scenarios:
+        scenarios = [os.path.join(pdir, s) for s in scenarios]
+
+    # Create y mask and difference dependent variables
+    ymin = scales.get(y, {}).get("min")
+    ymax = scales.get(y, {}).get("max")
+    units = config.units[y]
+    if diff == "off" and mask == "mask_off":
+        path2 = None
+    elif diff == "on":
+        ymin = -50
+        ymax = 50
+
+    # Combine threshold and its field
+    threshold = [threshold_field, threshold]
+
+    # Get map elements from data signal
+    if chart == "cumsum":
+        x = "capacity"
+
+    # Unpack recalc table
+    if recalc_table:
+        recalc_table = json.loads(recalc_table)
+
+    # Return appropriate difference units
+    if diff == "on":
+        if diff_units == "original":
+            units = config.units[y]
+        else:
+            units = "%"
+
+    # Let's just recycle all this for the chart
+    signal = {
+        "diff": diff,
+        "mask": mask,
+        "path": path,
+        "path2": path2,
+        "project": project,
+        "recalc": recalc,
+        "recalc_table": recalc_table,
+        "added_scenarios": scenarios,
+        "states": states,
+        "threshold": threshold,
+        "units": units,
+        "x": x,
+        "y": y,
+        "ymin": ymin,
+        "ymax": ymax,
+    }
+    return signal
+
+
 def build_specs(scenario, project):
     """Calculate the percentage of each scenario present."""
     config = Config(project)
@@ -360,11 +457,16 @@ def build_title(df, signal_dict, weights=True): # ---------------------------> T
     return title
 
 
-def calc_mask(df1, df2, threshold, threshold_field):
+def calc_mask(df1, df2, threshold, threshold_field, index1=None,
+              index2=None):
     """Remove the areas in df2 under the threshold from df1."""
     # How to deal with mismatching grids?
-    tidx = df2["sc_point_gid"][df2[threshold_field] <= threshold].values
-    df = df1[~df1["sc_point_gid"].isin(tidx)]
+    if index1 is None:
+        index1 = threshold_index(df1, fields=[])
+    if index2 is None:
+        index2 = threshold_index(df2, fields=[threshold_field])
+    under = index2.below(threshold_field, threshold, inclusive=True)
+    df = df1[~index1.contains(index2.bitmap(under))]
     return df
 
 
@@ -385,9 +487,141 @@ def calc_remaining_capacity(mapcap, mapsel):
         return total_print
 
 
-@cache.memoize()
+def least_cost_progress_path(project):
+    """Return the path to a project's least cost progress file."""
+    config = Config(project)
+    return os.path.join(config.directory, "review_outputs",
+                        ".least_cost_progress.json")
+
+
+def data_signal(signal_dict, chart=False):
+    """Return only the parts of a signal that change its data, normalized.
+
+    Map and chart signals that would build the same tables become the same
+    dictionary, with keys in a fixed order, so they share cache entries.
+    The fingerprints of the tables are included, so a table that changes
+    gets new entries.
+
+    Parameters
+    ----------
+    signal_dict : dict
+        A signal from retrieve_signal.
+    chart : bool
+        Keep the added scenarios for the chart tables.
+
+    Returns
+    -------
+    dict
+        The normalized data fields of the signal.
+    """
+    def normpath(path):
+        if path:
+            return os.path.normpath(os.path.abspath(os.path.expanduser(path)))
+        return None
+
+    # Thresholds are only applied if there's a value
+    threshold_field, threshold = signal_dict["threshold"]
+    if threshold is None or threshold == "":
+        threshold_field, threshold = None, None
+    elif is_number(threshold):
+        threshold = float(threshold)
+
+    # The second table is only used to difference or mask
+    path2 = normpath(signal_dict["path2"])
+    diff = signal_dict["diff"] if path2 else "off"
+    mask = signal_dict["mask"] if path2 and threshold else "mask_off"
+    if diff != "on" and mask != "mask_on":
+        path2 = None
+
+    # Recalc parameters are only used if recalc is on
+    recalc = signal_dict["recalc"]
+    recalc_table = signal_dict["recalc_table"] or {}
+    recalc_a = recalc_table.get("scenario_a")
+    recalc_b = recalc_table.get("scenario_b")
+    if recalc != "on":
+        recalc, recalc_a, recalc_b = "off", None, None
+    if recalc_a:
+        recalc_a = {k: recalc_a[k] for k in sorted(recalc_a)}
+    if recalc_b and path2:
+        recalc_b = {k: recalc_b[k] for k in sorted(recalc_b)}
+    else:
+        recalc_b = None
+
+    states = signal_dict["states"]
+    if states:
+        states = sorted(set(states))
+    else:
+        states = None
+
+    path = normpath(signal_dict["path"])
+    signal = {
+        "diff": diff,
+        "fingerprints": fingerprints([path, path2]),
+        "mask": mask,
+        "path": path,
+        "path2": path2,
+        "project": signal_dict["project"],
+        "recalc": recalc,
+        "recalc_table": {"scenario_a": recalc_a, "scenario_b": recalc_b},
+        "states": states,
+        "threshold": [threshold_field, threshold],
+        "units": signal_dict["units"] if diff == "on" else None,
+        "x": signal_dict["x"],
+        "y": signal_dict["y"]
+    }
+
+    if chart:
+        scenarios = signal_dict.get("added_scenarios") or []
+        signal["added_scenarios"] = [normpath(s) for s in scenarios]
+        signal["fingerprints"] += fingerprints(signal["added_scenarios"])
+        signal = {key: signal[key] for key in sorted(signal)}
+
+    return signal
+
+
+def fingerprints(paths):
+    """Return the fingerprint of each file in a list (None if missing)."""
+    keys = []
+    for path in paths:
+        try:
+            keys.append(fingerprint_key(path) if path else None)
+        except OSError:
+            keys.append(None)
+    return keys
+
+
+def signal_sources(signal_dict, *args, **kwargs):
+    """Return the paths to the tables a data signal is built from."""
+    paths = [signal_dict["path"], signal_dict["path2"]]
+    paths += signal_dict.get("added_scenarios") or []
+    return paths
+
+
+def table_key(project, path, recalc_table=None, recalc="off"):
+    """Return a key for the current version of a table from cache_table."""
+    try:
+        fprint = fingerprint_key(path)
+    except OSError:
+        return None
+    if recalc == "on":
+        recalc_table = json.dumps(recalc_table, sort_keys=True)
+    else:
+        recalc_table = None
+    return (project, path, fprint, recalc_table)
+
+
 def cache_table(project, path, recalc_table=None, recalc="off"):
-    """Read in just a single table."""
+    """Read in just a single table, cached on its current fingerprint."""
+    fingerprint = fingerprints([path])[0]
+    return cache_table_version(project, path, recalc_table, recalc,
+                               fingerprint)
+
+
+@single_flight(cache, registry=sources,
+               sources=lambda project, path, *args: [path])
+@cache.memoize()
+def cache_table_version(project, path, recalc_table, recalc, fingerprint):
+    """Read in just a single table (one version of it)."""
     # Get the table
     data = Data(project)
     if recalc == "on" and path in data.files.values():
@@ -405,94 +639,20 @@ def cache_table(project, path, recalc_table=None, recalc="off"):
     return df
 
 
+@single_flight(cache2, registry=sources, sources=signal_sources)
 @cache2.memoize()
 def cache_map_data(signal_dict):
     """Read and store a data frame from the config and options given."""
-    # Get signal elements
-    diff = signal_dict["diff"]
-    mask = signal_dict["mask"]
-    path = signal_dict["path"]
-    path2 = signal_dict["path2"]
-    project = signal_dict["project"]
-    recalc_table = signal_dict["recalc_table"]
-    recalc = signal_dict["recalc"]
-    states = signal_dict["states"]
-    threshold = signal_dict["threshold"]
-    units = signal_dict["units"]
-    x = signal_dict["x"]
-    y = signal_dict["y"]
-
-    # Unpack recalc table
-    recalc_a = recalc_table["scenario_a"]
-    recalc_b = recalc_table["scenario_b"]
-
-    # Read and cache first table
-    df1 = cache_table(project, path, recalc_a, recalc)
-
-    # Separate the threshold values out
-    threshold_field = threshold[0]
-    threshold = threshold[1]
-
-    # Is it faster to subset columns before rows?
-    keepers = [y, x, "print_capacity", "total_lcoe_threshold",
-               "mean_lcoe_threshold", "state", "nrel_region", "county",
-               "latitude", "longitude", "sc_point_gid", "n_gids", "gid_counts",
-               "index", "offshore"]
-    if "offshore" not in df1.columns:
-        keepers.remove("offshore")
-
-    df1 = df1[keepers]
-
-    # For other functions this data frame needs an x field
-    if y == x:
-        df1 = df1.iloc[:, 1:]
-
-    # If there's a second table, read/cache the difference
-    if path2:
-        # Match the format of the first dataframe
-        df2 = cache_table(project, path2, recalc_b, recalc)
-        df2 = df2[keepers]
-        if y == x:
-            df2 = df2.iloc[:, 1:]
-
-        # If the difference option is specified difference
-        if diff == "on":
-            calculator = Difference(units)
-            df = calculator.calc(df1, df2, y)
-        else:
-            df = df1.copy()
-
-        # If mask, try that here
-        if mask == "mask_on":
-            if threshold:
-                df = calc_mask(df, df2, threshold, threshold_field)
-    else:
-        df = df1.copy()
-
-    # If threshold, calculate this for the final df here
-    if threshold:
-        df = df[df[threshold_field] < threshold]
-
-    # Finally filter for states
-    if states:
-        if any([s in df["state"].values for s in states]):
-            df = df[df["state"].isin(states)]
-
-        if "offshore" in states:
-            df = df[df["offshore"] == 1]
-        if "onshore" in states:
-            df = df[df["offshore"] == 0]
-
-    return df
+    return filter_table(signal_dict)
 
 
+@single_flight(cache3, registry=sources, sources=signal_sources)
 @cache3.memoize()
 def cache_chart_tables(signal_dict, region="national", idx=None):
     """Read and store a data frame from the config and options given."""
     signal_copy = signal_dict.copy()
 
     # Unpack subsetting information
-    states = signal_copy["states"]
     x = signal_copy["x"]
     y = signal_copy["y"]
 
@@ -510,33 +670,20 @@ def cache_chart_tables(signal_dict, region="national", idx=None):
     for file in files:
         signal = signal_copy.copy()
         signal["path"] = file
+        signal["fingerprints"] = fingerprints([file, signal["path2"]])
         signal_dicts.append(signal)
 
     # Get the requested data frames
     dfs = {}
     for signal in signal_dicts:
         name = build_name(signal["path"])
-        df = cache_map_data(signal)
-        if "offshore" in df.columns:
-            df = df[[x, y, "state", "nrel_region", "print_capacity", "index",
-                     "sc_point_gid", "gid_counts", "n_gids", "offshore"]]
-        else:
-            df = df[[x, y, "state", "nrel_region", "print_capacity", "index",
-                     "sc_point_gid", "gid_counts", "n_gids"]]
-
-        # Subset by index selection
+        columns = [x, y, "state", "nrel_region", "print_capacity", "index",
+                   "sc_point_gid", "gid_counts", "n_gids", "offshore"]
         if idx:
-            df = df.iloc[idx]
-
-        # Subset by state selection
-        if states:
-            if any([s in df["state"] for s in states]):
-                df = df[df["state"].isin(states)]
-
-            if "offshore" in states:
-                df = df[df["offshore"] == 1]
-            if "onshore" in states:
-                df = df[df["offshore"] == 0]
+            df = filter_table(signal, idx=idx, columns=columns)
+        else:
+            df = cache_map_data(signal)
+            df = df[[c for c in columns if c in df.columns]]
 
         # Divide into regions if one table (cancel otherwise for now)
         if region != "national" and len(signal_dicts) == 1:
@@ -548,6 +695,147 @@ def cache_chart_tables(signal_dict, region="national", idx=None):
     return dfs
 
 
+def filter_pipeline(signal_dict):
+    """Return the filter pipeline over the base table of a map signal.
+
+    The base table is the first table's map fields, differenced from the
+    second table's if requested, before any rows are filtered. Pipelines are
+    kept in this process so their masks can be reused between signals.
+    """
+    # Get signal elements
+    diff = signal_dict["diff"]
+    path = signal_dict["path"]
+    path2 = signal_dict["path2"]
+    project = signal_dict["project"]
+    recalc_table = signal_dict["recalc_table"]
+    recalc = signal_dict["recalc"]
+    units = signal_dict["units"]
+    x = signal_dict["x"]
+    y = signal_dict["y"]
+
+    # Unpack recalc table
+    recalc_a = recalc_table["scenario_a"]
+    recalc_b = recalc_table["scenario_b"]
+
+    # The base table only depends on these
+    key1 = table_key(project, path, recalc_a, recalc)
+    if path2 and diff == "on":
+        key2 = table_key(project, path2, recalc_b, recalc)
+        key = (key1, key2, x, y, units)
+    else:
+        key = (key1, x, y)
+    if None not in key:
+        with _PIPELINES_LOCK:
+            pipeline = _PIPELINES.pop(key, None)
+            if pipeline is not None:
+                _PIPELINES[key] = pipeline
+                return pipeline
+
+    # Read and cache first table
+    df1 = cache_table(project, path, recalc_a, recalc)
+
+    # Is it faster to subset columns before rows?
+    keepers = [y, x, "print_capacity", "total_lcoe_threshold",
+               "mean_lcoe_threshold", "state", "nrel_region", "county",
+               "latitude", "longitude", "sc_point_gid", "n_gids", "gid_counts",
+               "index", "offshore"]
+    if "offshore" not in df1.columns:
+        keepers.remove("offshore")
+
+    # Least cost fields (e.g. runner_up_scenario) are offered for every
+    # table, so tables without them get empty ones
+    df1 = select_fields(df1, keepers)
+
+    # For other functions this data frame needs an x field
+    if y == x:
+        df1 = df1.iloc[:, 1:]
+
+    # If the difference option is specified difference the second table
+    if path2 and diff == "on":
+        df2 = cache_table(project, path2, recalc_b, recalc)
+        df2 = select_fields(df2, keepers)
+        if y == x:
+            df2 = df2.iloc[:, 1:]
+        calculator = Difference(units)
+        gid_key = None if None in (key1, key2) else (key1, key2)
+        df1 = calculator.calc(df1, df2, y, key=gid_key)
+
+    # Hover text locations only depend on the table, so build them once
+    df1["location"] = build_locations(df1)
+
+    pipeline = Filter_Pipeline(df1)
+    if None not in key:
+        with _PIPELINES_LOCK:
+            _PIPELINES[key] = pipeline
+            while len(_PIPELINES) > PIPELINE_LIMIT:
+                del _PIPELINES[next(iter(_PIPELINES))]
+
+    return pipeline
+
+
+def filter_table(signal_dict, gids=None, idx=None, columns=None):
+    """Filter the base table of a map signal.
+
+    Parameters
+    ----------
+    signal_dict : dict
+        The map signal, with the table paths and filters.
+    gids : list, optional
+        Keep only these sc_point_gids (e.g. a chart selection).
+    idx : list, optional
+        Keep only these positions of the otherwise filtered table (e.g. a
+        map selection).
+    columns : list, optional
+        The columns to return, where they exist. The default of None
+        returns all of them.
+
+    Returns
+    -------
+    pd.core.frame.DataFrame
+        The filtered rows of the base table.
+    """
+    # Get signal elements
+    mask = signal_dict["mask"]
+    path2 = signal_dict["path2"]
+    project = signal_dict["project"]
+    recalc = signal_dict["recalc"]
+    states = signal_dict["states"]
+    threshold_field, threshold = signal_dict["threshold"]
+    recalc_b = signal_dict["recalc_table"]["scenario_b"]
+
+    # Each filter's mask is kept in the pipeline
+    pipeline = filter_pipeline(signal_dict)
+    masks = []
+    if threshold:
+        masks.append(pipeline.threshold(threshold_field, threshold))
+        if path2 and mask == "mask_on":
+            df2 = cache_table(project, path2, recalc_b, recalc)
+            key2 = table_key(project, path2, recalc_b, recalc)
+            index2 = threshold_index(df2, key2, fields=[threshold_field])
+            masks.append(pipeline.mask(index2, threshold_field, threshold))
+    if states:
+        masks.append(pipeline.states(states))
+    if gids is not None:
+        masks.append(pipeline.gids(gids))
+    keep = pipeline.combine(*masks)
+    if idx:
+        keep = pipeline.select(keep, idx)
+
+    if columns is not None:
+        columns = [c for c in columns if c in pipeline.df.columns]
+
+    return pipeline.apply(keep, columns)
+
+
+def select_fields(df, fields):
+    """Return the fields of a table, filling any it doesn't have with NaN."""
+    missing = [f for f in fields if f not in df.columns]
+    if missing:
+        print(f"Fields not found, filling with NaN: {missing}")
+        return df.reindex(columns=fields)
+    return df[fields]
+
+
 @app.callback([Output("chart_options_tab", "children"),
                Output("chart_options_div", "style"),
                Output("chart_xvariable_options_div", "style"),
@@ -615,6 +903,8 @@ def options_lchh_group(group, filedf):
         filedf = pd.DataFrame(filedf)
         options = filedf[group].unique()
         option_list = [{"label": o, "value": o} for o in options]
+        option_list.append({"label": "All (one table each)",
+                            "value": ALL_LEVELS})
         return option_list, options[0]
     else:
         raise PreventUpdate
@@ -718,6 +1008,12 @@ def options_options(project, lc_update, n_clicks):
     variable_options = []
     for k, v in config.project_config["titles"].items():
         variable_options.append({"label": v, "value": k})
+
+    # Least cost tables add runner-up and margin fields
+    if scenario_outputs:
+        for k, v in TITLES.items():
+            if "runner_up" in k or k.endswith("_margin"):
+                variable_options.append({"label": v, "value": k})
     least_cost_options = []
     for key, file in file_list.items():
         if file in config.project_config["data"]["file"].values():
@@ -1042,7 +1338,7 @@ def retrieve_low_cost(submit, project, how, lst, group, group_choice, options,
             fname = f"least_cost_by_{by}__{recalc_tag}__all_sc.csv"
         else:
             fname = f"least_cost_by_{by}_all_sc.csv"
-        paths = filedf["file"].values
+        fnames = {fname: filedf["file"].values}
 
     elif how == "list":
         # Just one output
@@ -1053,38 +1349,92 @@ def retrieve_low_cost(submit, project, how, lst, group, group_choice, options,
             fname = f"least_cost_by_{by}_{scen_key}__{recalc_tag}__sc.csv"
         else:
             fname = f"least_cost_by_{by}_{scen_key}_sc.csv"
+        fnames = {fname: paths}
 
     else:
-        # This could create multiple outputs, but we'll do one at a time
-        grp_key = group_choice.replace(".", "")
-        if recalc_table and recalc == "on":
-            fname = (f"least_cost_by_{by}_{group}_{grp_key}__{recalc_tag}_"
-                     "_sc.csv")
+        # One output per chosen level, or for every level in one pass
+        if group_choice == ALL_LEVELS:
+            choices = filedf[group].unique()
         else:
-            fname = f"least_cost_by_{by}_{group}_{grp_key}_sc.csv"
-        paths = filedf["file"][filedf[group] == group_choice].values
-
-    # Build full paths and create the target file
-    paths = [DP.join(path) for path in paths]
-    lchh_path = DP.join("review_outputs", fname, mkdir=True)
+            choices = [group_choice]
+        fnames = {}
+        for choice in choices:
+            grp_key = str(choice).replace(".", "")
+            if recalc_table and recalc == "on":
+                fname = (f"least_cost_by_{by}_{group}_{grp_key}__{recalc_tag}"
+                         "__sc.csv")
+            else:
+                fname = f"least_cost_by_{by}_{group}_{grp_key}_sc.csv"
+            fnames[fname] = filedf["file"][filedf[group] == choice].values
+
+    # Build full paths and create the target files
+    groups = {}
+    for fname, paths in fnames.items():
+        lchh_path = DP.join("review_outputs", fname, mkdir=True)
+        groups[lchh_path] = [DP.join(path) for path in paths]
     # print("calculating" + " " + lchh_path + "...")
     if recalc == "on":
         calculator = Least_Cost(project, recalc_table=recalc_table)
     else:
         calculator = Least_Cost(project)
-    calculator.calc(paths, lchh_path, by=by)
+
+    # Share progress with the low cost progress callback
+    progress_path = least_cost_progress_path(project)
+
+    def progress(stage, done, total):
+        with open(progress_path, "w") as file:
+            json.dump({"stage": stage, "done": done, "total": total}, file)
+
+    try:
+        calculator.calc_groups(groups, by=by, progress=progress)
+    finally:
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
 
     # Update the scenario file options
-    label = " ".join([f.capitalize() for f in fname.split("_")[:-1]])
-    option = {"label": label, "value": lchh_path}
-    if label not in [o["label"] for o in options]:
-        options.append(option)
-    else:
-        options.remove(option)
-        options.append(option)
+    for fname, lchh_path in zip(fnames, groups):
+        label = " ".join([f.capitalize() for f in fname.split("_")[:-1]])
+        option = {"label": label, "value": lchh_path}
+        if label not in [o["label"] for o in options]:
+            options.append(option)
+        else:
+            options.remove(option)
+            options.append(option)
     return json.dumps(options)
 
 
+@app.callback(Output("low_cost_interval", "disabled"),
+              [Input("low_cost_submit", "n_clicks"),
+               Input("catch_low_cost", "children")])
+def toggle_low_cost_progress(submit, catch):
+    """Check least cost progress only while calculating."""
+    trig = dash.callback_context.triggered[0]['prop_id']
+    if not submit:
+        raise PreventUpdate
+    return "low_cost_submit" not in trig
+
+
+@app.callback(Output("low_cost_progress", "children"),
+              [Input("low_cost_interval", "n_intervals"),
+               Input("low_cost_interval", "disabled")],
+              [State("project", "value")])
+def retrieve_low_cost_progress(n, disabled, project):
+    """Report the progress of the current least cost calculation."""
+    if disabled:
+        return ""
+
+    path = least_cost_progress_path(project)
+    try:
+        with open(path, "r") as file:
+            status = json.load(file)
+    except (OSError, ValueError):
+        raise PreventUpdate
+
+    stages = {"minima": "Finding minima", "rows": "Extracting rows"}
+    stage = stages.get(status["stage"], status["stage"])
+    return f"{stage}: {status['done']}/{status['total']} tables"
+
+
 # Map callbacks
 @app.callback(Output("chart_data_signal", "children"),
               [Input("variable", "value"),
@@ -1103,7 +1453,8 @@ def retrieve_chart_tables(y, x, state):
                Input("state_options", "value"),
                Input("chart_options", "value"),
                Input("chart_xvariable_options", "value"),
-               Input("chart_scenarios", "value")],
+               Input("chart_scenarios", "value"),
+               Input("recalc_table", "children")],
               [State("project", "value"),
                State("upper_lcoe_threshold", "value"),
                State("threshold_field", "value"),
@@ -1114,18 +1465,17 @@ def retrieve_chart_tables(y, x, state):
                State("difference", "value"),
                State("low_cost_tabs", "value"),
                State("threshold_mask", "value"),
-               State("recalc_table", "children"),
                State("recalc_tab", "value"),
                State("difference_units", "value")])
-def retrieve_signal(submit, states, chart, x, scenarios, project, threshold,
-                    threshold_field, path, path2, lchh_path, y, diff,
-                    lchh_toggle, mask, recalc_table, recalc, diff_units):
+def retrieve_signal(submit, states, chart, x, scenarios, recalc_table,
+                    project, threshold, threshold_field, path, path2,
+                    lchh_path, y, diff, lchh_toggle, mask, recalc, diff_units):
     """Create signal for sharing data between map and chart with dependence."""
     trig = dash.callback_context.triggered[0]['prop_id']
-    # print_args(retrieve_signal, submit, states, chart, x, scenarios, project,
-    #            threshold, threshold_field, path, path2, lchh_path, y, diff,
-    #            lchh_toggle, mask, recalc_table, recalc, diff_units,
-    #            trig=trig)
+    # print_args(retrieve_signal, submit, states, chart, x, scenarios,
+    #            recalc_table, project, threshold, threshold_field, path,
+    #            path2, lchh_path, y, diff, lchh_toggle, mask, recalc,
+    #            diff_units, trig=trig)
 
     # Prevent the first trigger when difference is off
     if "scenario_b" in trig and diff == "off":
@@ -1135,68 +1485,17 @@ def retrieve_signal(submit, states, chart, x, scenarios, project, threshold,
     if "mask" in trig and mask == "off":
         raise PreventUpdate
 
-    # Get/build the value scale table
-    config = Config(project)
-    scales = config.project_config["scales"]
-
-    # Get the full path from the config
-    pdir = config.directory
-    path = os.path.join(pdir, path)
-    if path2:
-        path2 = os.path.join(pdir, path2)
-    if scenarios:
-        scenarios = [os.path.join(pdir, s) for s in scenarios]
-
-    # Create y mask and difference dependent variables
-    ymin = scales[y]["min"]
-    ymax = scales[y]["max"]
-    units = config.units[y]
-    if diff == "off" and mask == "mask_off":
-        path2 = None
-    elif diff == "on":
-        ymin = -50
-        ymax = 50
+    # Recalc values update the map as they're typed, but only if recalc is on
+    if "recalc_table" in trig and recalc == "off":
+        raise PreventUpdate
 
     # Here we will retrieve either ...
     if "lchh_path" in trig and lchh_toggle == "on":
         path = lchh_path
 
-    # Combine threshold and its field
-    threshold = [threshold_field, threshold]
-
-    # Get map elements from data signal
-    if chart == "cumsum":
-        x = "capacity"
-
-    # Unpack recalc table
-    if recalc_table:
-        recalc_table = json.loads(recalc_table)
-
-    # Return appropriate difference units
-    if diff == "on":
-        if diff_units == "original":
-            units = config.units[y]
-        else:
-            units = "%"
-
-    # Let's just recycle all this for the chart
-    signal = {
-        "diff": diff,
-        "mask": mask,
-        "path": path,
-        "path2": path2,
-        "project": project,
-        "recalc": recalc,
-        "recalc_table": recalc_table,
-        "added_scenarios": scenarios,
-        "states": states,
-        "threshold": threshold,
-        "units": units,
-        "x": x,
-        "y": y,
-        "ymin": ymin,
-        "ymax": ymax,
-    }
+    signal = build_signal(states, chart, x, scenarios, recalc_table, project,
+                          threshold, threshold_field, path, path2, y, diff,
+                          mask, recalc, diff_units)
     return json.dumps(signal)
 
 
@@ -1301,7 +1600,13 @@ def make_map(signal, basemap, color, chartsel, point_size, rev_color, uymin,
 
     # Get map elements from data signal
     signal_dict = json.loads(signal)
-    df = cache_map_data(signal_dict)
+    map_signal = data_signal(signal_dict)
+    record_signal(map_signal)
+    if chartsel and len(chartsel["points"]) > 0:
+        gids = [p["customdata"][0] for p in chartsel["points"]]
+        df = filter_table(map_signal, gids=gids)
+    else:
+        df = cache_map_data(map_signal)
     df.index = df["index"]
     units = signal_dict["units"]
     x = signal_dict["x"]
@@ -1327,10 +1632,6 @@ def make_map(signal, basemap, color, chartsel, point_size, rev_color, uymin,
     if uymax:
         ymax = uymax
 
-    # If there is a selection in the chart filter these points
-    if chartsel and len(chartsel["points"]) > 0:
-        df = point_filter(df, chartsel)
-
     # Store the capacity values up to this point
     mapcap = df[["sc_point_gid", "print_capacity"]].to_dict()
 
@@ -1380,7 +1681,7 @@ def make_chart(signal, chart, mapsel, point_size, op_values, region, uymin,
     # Turn the map selection object into indices
     if mapsel:
         if len(mapsel["points"]) > 0:
-            idx = [d["pointIndex"] for d in mapsel["points"]]
+            idx = sorted({d["pointIndex"] for d in mapsel["points"]})
         else:
             idx = None
     else:
@@ -1388,7 +1689,10 @@ def make_chart(signal, chart, mapsel, point_size, op_values, region, uymin,
 
     # Get the data frames
     group = "Scenario"
-    dfs = cache_chart_tables(signal_dict, region, idx)
+    chart_signal = data_signal(signal_dict, chart=True)
+    if region == "national" and not idx:
+        record_signal(chart_signal, kind="chart")
+    dfs = cache_chart_tables(chart_signal, region, idx)
     plotter = Plots(project, dfs, point_size, group=group, yunits=units,
                     xbin=xbin)
 
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""Warm the data caches in the background.
+
+The first person to open a page after a deploy otherwise pays for reading
+and filtering every table on it. The Warmer loads the map and chart tables
+of the default pages, and of the signals requested most often recently, into
+the caches when the server starts and again whenever the review config
+changes. It uses a small, fixed number of threads so live requests aren't
+starved while it works, and only one server process warms at a time (each
+process starts a Warmer, but the others wait on a lock file in case that
+one exits).
+
+Signals are recorded by the map and chart callbacks with record_signal.
+Each process counts them in memory and adds its counts to a small json file
+of counts at most every FLUSH_INTERVAL seconds. Counts are halved whenever
+their total passes POPULAR_LIMIT, so the file stays small and recent
+requests weigh more.
+
+Created on Sun Oct 18 15:21:09 2026
+
+@author: twillia2
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from review.caching import LOCK_FOLDER, Flight
+from review.support import CONFIG_PATH
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 60
+POPULAR_PATH = "data/popular_signals.json"
+POPULAR_LIMIT = 5000
+_PENDING = {}
+_PENDING_LOCK = threading.Lock()
+_FLUSHED = {}
+
+
+def default_signal(defaults):
+    """Return the map signal of a page's initial layout.
+
+    Parameters
+    ----------
+    defaults : review.support.Defaults
+        The defaults a page layout was built with.
+
+    Returns
+    -------
+    dict
+        The signal retrieve_signal builds from the initial values of the
+        page's options, as the map and chart callbacks receive it.
+    """
+    import scenario_page
+    from layouts import scenario_layout
+
+    values = layout_values(scenario_layout(defaults))
+    signal = scenario_page.build_signal(
+        states=values["state_options"],
+        chart=values["chart_options"],
+        x=values["chart_xvariable_options"],
+        scenarios=values.get("chart_scenarios"),
+        recalc_table=values["recalc_table"],
+        project=values["project"],
+        threshold=values["upper_lcoe_threshold"],
+        threshold_field=values["threshold_field"],
+        path=values["scenario_a"],
+        path2=values["scenario_b"],
+        y=values["variable"],
+        diff=values["difference"],
+        mask=values["threshold_mask"],
+        recalc=values["recalc_tab"],
+        diff_units=values["difference_units"]
+    )
+
+    # The callbacks receive the signal as json
+    return json.loads(json.dumps(signal))
+
+
+def layout_values(component, values=None):
+    """Return the initial value of each component in a layout by id.
+
+    Components without a value (e.g. hidden divs holding json) give their
+    children instead.
+    """
+    if values is None:
+        values = {}
+    props = component.to_plotly_json()["props"]
+    if isinstance(props.get("id"), str):
+        values[props["id"]] = props.get("value", props.get("children"))
+    children = props.get("children")
+    if not isinstance(children, (list, tuple)):
+        children = [children]
+    for child in children:
+        if hasattr(child, "to_plotly_json"):
+            layout_values(child, values)
+    return values
+
+
+def flush_signals():
+    """Add the signal counts recorded in this process to their files.
+
+    Counts that can't be written are kept for the next flush.
+    """
+    with _PENDING_LOCK:
+        pending = dict(_PENDING)
+        _PENDING.clear()
+        for path in pending:
+            _FLUSHED[path] = time.time()
+
+    for path, counts in pending.items():
+        try:
+            with Flight(("popular_signals", os.path.abspath(path))):
+                total = read_counts(path) + counts
+                if sum(total.values()) > POPULAR_LIMIT:
+                    total = Counter({k: v // 2 for k, v in total.items()
+                                     if v > 1})
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, "w") as file:
+                    json.dump(total, file)
+                os.replace(tmp, path)
+        except OSError as error:
+            logger.warning("Could not record signals to %s: %s", path, error)
+            with _PENDING_LOCK:
+                _PENDING.setdefault(path, Counter()).update(counts)
+
+
+def popular_signals(top=10, path=POPULAR_PATH):
+    """Return the most often recorded signals.
+
+    Parameters
+    ----------
+    top : int
+        The number of signals to return.
+    path : str
+        The file signal counts were recorded to.
+
+    Returns
+    -------
+    list
+        Up to top (kind, signal) tuples, most popular first.
+    """
+    counts = read_counts(path)
+    return [tuple(json.loads(key)) for key, _ in counts.most_common(top)]
+
+
+def read_counts(path=POPULAR_PATH):
+    """Read the signal counts in a file into a Counter."""
+    try:
+        with open(path, "r") as file:
+            return Counter(json.load(file))
+    except (OSError, ValueError, TypeError):
+        return Counter()
+
+
+def record_signal(signal, kind="map", path=POPULAR_PATH):
+    """Count a requested data signal for the warmer.
+
+    Parameters
+    ----------
+    signal : dict
+        A map or chart signal from data_signal.
+    kind : str
+        "map" or "chart".
+    path : str
+        The file to record signal counts to.
+    """
+    signal = {k: v for k, v in signal.items() if k != "fingerprints"}
+    key = json.dumps([kind, signal], sort_keys=True)
+    with _PENDING_LOCK:
+        _PENDING.setdefault(path, Counter())[key] += 1
+        flush = time.time() - _FLUSHED.setdefault(path, 0) > FLUSH_INTERVAL
+    if flush:
+        flush_signals()
+
+
+atexit.register(flush_signals)
+
+
+class Warmer:
+    """Methods for loading default and popular tables into the caches."""
+
+    def __init__(self, server, defaults=None, workers=2, top=10,
+                 interval=60, path=POPULAR_PATH):
+        """Initialize Warmer object.
+
+        Parameters
+        ----------
+        server : flask.app.Flask
+            The server the caches belong to.
+        defaults : list, optional
+            The Defaults objects of the pages to warm.
+        workers : int
+            The most tables to build at once. Only one server process warms
+            at a time, so this is the limit across all of them.
+        top : int
+            The number of popular signals to warm.
+        interval : int | float
+            Seconds between checks for a changed review config, or for the
+            lock while another process is warming.
+        path : str
+            The file signal counts are recorded to.
+        """
+        self.server = server
+        self.defaults = defaults or []
+        self.workers = workers
+        self.top = top
+        self.interval = interval
+        self.path = path
+        self._lock_file = None
+        self._thread = None
+
+    def __repr__(self):
+        """Return representation string for Warmer object."""
+        return (f"<Warmer: {len(self.defaults)} default pages, "
+                f"workers={self.workers}, top={self.top}>")
+
+    @property
+    def jobs(self):
+        """Return the (kind, signal) of each set of tables to warm."""
+        jobs = []
+        for defaults in self.defaults:
+            try:
+                signal = default_signal(defaults)
+            except Exception as error:
+                logger.warning("Could not build default signal: %s", error)
+                continue
+            jobs.append(("map", signal))
+            jobs.append(("chart", signal))
+
+        jobs += popular_signals(self.top, self.path)
+
+        # Drop duplicates
+        keys = [json.dumps(job, sort_keys=True) for job in jobs]
+        return [job for i, job in enumerate(jobs) if keys[i] not in keys[:i]]
+
+    def run(self):
+        """Warm the caches, then again every time the config changes.
+
+        Only the process holding the warmer's lock file warms, the others
+        check for it every interval in case that process exits.
+        """
+        while not self._lock():
+            time.sleep(self.interval)
+
+        mtime = self._config_mtime()
+        self.warm()
+        while True:
+            time.sleep(self.interval)
+            new_mtime = self._config_mtime()
+            if new_mtime != mtime:
+                mtime = new_mtime
+                self.warm()
+
+    def start(self):
+        """Run the warmer in a background thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self.run, daemon=True,
+                                            name="review-warmer")
+            self._thread.start()
+        return self._thread
+
+    def warm(self):
+        """Load the tables of every job into the caches."""
+        jobs = self.jobs
+        start = time.time()
+        with ThreadPoolExecutor(self.workers) as pool:
+            done = sum(pool.map(self._warm, jobs))
+        seconds = round(time.time() - start, 2)
+        logger.info("Warmed %s of %s cache entries in %ss.", done, len(jobs),
+                    seconds)
+
+    def _config_mtime(self):
+        """Return the modification time of the review config."""
+        try:
+            return os.stat(CONFIG_PATH).st_mtime_ns
+        except OSError:
+            return None
+
+    def _lock(self):
+        """Try to take the lock that lets one process warm the caches."""
+        if fcntl is None:
+            return True
+        try:
+            os.makedirs(LOCK_FOLDER, exist_ok=True)
+            path = os.path.join(LOCK_FOLDER, "review_warmer.lock")
+            file = open(path, "a")
+        except OSError as error:
+            logger.warning("Could not open the warmer lock, warming anyway: "
+                           "%s", error)
+            return True
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            file.close()
+            return False
+
+        # Held until this process exits
+        self._lock_file = file
+        return True
+
+    def _warm(self, job):
+        """Load the tables of one job, returning whether it worked."""
+        import scenario_page
+
+        kind, signal = job
+        try:
+            with self.server.app_context():
+                if kind == "chart":
+                    signal = scenario_page.data_signal(signal, chart=True)
+                    scenario_page.cache_chart_tables(signal, "national", None)
+                else:
+                    signal = scenario_page.data_signal(signal)
+                    scenario_page.cache_map_data(signal)
+        except Exception as error:
+            logger.warning("Could not warm %s tables for %s: %s", kind,
+                           signal["path"], error)
+            return False
+        return True
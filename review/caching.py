@@ -0,0 +1,993 @@
+# -*- coding: utf-8 -*-
+"""Cache backends for the reView server.
+
+The flask-caching filesystem backend pickles every entry, so each worker
+process unpickles its own private copy of a table on every hit. The TablePool
+backend stores data frames as uncompressed Arrow IPC files instead and memory
+maps them on read, so every worker shares the same read-only column buffers
+through the page cache. Anything that isn't a data frame is pickled as usual.
+
+Data frames can instead be written as LZ4 or Zstandard compressed Arrow
+files with repeated strings (states, counties, etc.) dictionary encoded,
+which are much smaller and still fast to read, but can't be shared through
+the page cache. Choose with CACHE_TABLE_FORMAT: "arrow" (the default),
+"arrow_lz4", "arrow_zstd", or "pickle".
+
+In front of the files, each process keeps a least recently used set of live
+entries up to a memory budget, so repeated hits skip decoding altogether.
+The files themselves can be pruned to a disk budget rather than a count.
+
+Hits are not copied. Data frames are handed out as shallow copies of the
+entry kept in the process, so callers can add, replace, or drop columns and
+set the index freely, but the values themselves are shared and read-only
+(memory-mapped columns can't be written to at all). Copy a frame before
+writing values into it (e.g. with df.loc).
+
+Use it by pointing a flask-caching config at this class:
+
+    cache = Cache(config={"CACHE_TYPE": "review.caching.TablePool",
+                          "CACHE_DIR": "data/cache",
+                          "CACHE_THRESHOLD": 0,
+                          "CACHE_MEMORY_LIMIT": 1024 ** 3,
+                          "CACHE_DISK_LIMIT": 10 * 1024 ** 3,
+                          "CACHE_TABLE_FORMAT": "arrow"})
+
+Either limit can be 0 to turn off the in-memory tier or the disk budget.
+
+Memoized functions can also be wrapped with single_flight, so that callers
+that miss on the same key at the same time, in any thread or worker process,
+wait for one of them to compute the entry instead of each computing it:
+
+    @single_flight(cache)
+    @cache.memoize()
+    def cache_table(project, path):
+        ...
+
+Each TablePool also counts its hits, misses, bytes, and evictions, and
+single_flight records the hits, misses, compute times, and entry sizes of
+the functions it wraps there. The app serves these counts, for the worker
+process that answers, at /_review/metrics as JSON or, with
+?format=prometheus, in the Prometheus text format.
+
+Entries built from supply-curve files can be registered against those
+files in a Source_Registry. When a file's fingerprint changes (it was
+regenerated or rewritten), every entry registered against it, in any
+cache, is deleted the next time one of its dependents is requested:
+
+    @single_flight(cache, registry=sources,
+                   sources=lambda project, path: [path])
+    @cache.memoize()
+    def cache_table(project, path):
+        ...
+
+Created on Sun Oct 18 11:03:27 2026
+
+@author: twillia2
+"""
+import copy
+import functools
+import hashlib
+import json
+import logging
+import os
+import pickle
+import struct
+import tempfile
+import threading
+
+from collections import OrderedDict
+from time import perf_counter, time
+
+import pandas as pd
+
+from flask_caching.backends.filesystemcache import FileSystemCache
+from review.columnar import fingerprint_key
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+# Every entry starts with its expiration time and a 4 byte type tag, which
+# keeps the Arrow payload 8-byte aligned for zero-copy reads
+HEADER = struct.Struct("I4s")
+ARROW = b"ARRW"
+PICKLE = b"PKL1"
+
+# Schema metadata key for how an Arrow entry was written
+METADATA = b"review"
+
+# Only update a file's access time on hits this often (seconds)
+TOUCH_INTERVAL = 60
+
+# Rescan the cache folder for the disk budget after this many sets, so
+# entries written by other processes are counted
+DISK_SCAN_INTERVAL = 100
+
+# Prune the cache folder to this share of the disk budget once it's over
+DISK_PRUNE_TARGET = 0.9
+
+# Lock files for single flight computations, kept out of the cache folders
+LOCK_FOLDER = os.path.join(tempfile.gettempdir(), "review_locks")
+
+
+def copy_value(value):
+    """Return a copy of a cache entry that callers can safely modify.
+
+    Data frames are copied with their data, containers of data frames are
+    copied one level down, and anything else is deep copied.
+    """
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, dict):
+        return {k: copy_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(copy_value(v) for v in value)
+    return copy.deepcopy(value)
+
+
+def share_value(value):
+    """Return a view of a cache entry that shares its data.
+
+    Data frames are shallow copied, so their columns and index can be
+    changed without changing the entry, but their values are the entry's.
+    Containers are copied one level down and anything else is deep copied.
+    """
+    if isinstance(value, pd.DataFrame):
+        return value.copy(deep=False)
+    if isinstance(value, dict):
+        return {k: share_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(share_value(v) for v in value)
+    return copy.deepcopy(value)
+
+
+def from_arrow(table):
+    """Convert an Arrow table from to_arrow back to a data frame."""
+    metadata = table.schema.metadata or {}
+    if METADATA in metadata:
+        encoded = json.loads(metadata[METADATA])["dictionary"]
+        for name in encoded:
+            i = table.schema.get_field_index(name)
+            column = table.column(i)
+            values = pa.chunked_array([c.dictionary_decode()
+                                       for c in column.chunks],
+                                      type=column.type.value_type)
+            table = table.set_column(i, name, values)
+    return table.to_pandas(split_blocks=True)
+
+
+def prometheus(metrics):
+    """Format the metrics of several caches in the Prometheus text format.
+
+    Parameters
+    ----------
+    metrics : dict
+        The TablePool.stats of each cache, keyed by cache name.
+
+    Returns
+    -------
+    str
+        One sample per line, labelled with the cache name and, for
+        function counts, the function name.
+    """
+    lines = []
+    for cache, stats in metrics.items():
+        labels = f'cache="{cache}"'
+        for key, value in stats["counters"].items():
+            lines.append(f"review_cache_{key}{{{labels}}} {value}")
+        for key in ["memory_bytes", "memory_entries", "disk_bytes",
+                    "disk_entries"]:
+            if key in stats:
+                lines.append(f"review_cache_{key}{{{labels}}} {stats[key]}")
+        for function, counts in stats["functions"].items():
+            flabels = f'{labels},function="{function}"'
+            for key, value in counts.items():
+                lines.append(f"review_function_{key}{{{flabels}}} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def single_flight(cache, folder=LOCK_FOLDER, registry=None, sources=None):
+    """Make concurrent misses of a memoized function share one computation.
+
+    Parameters
+    ----------
+    cache : flask_caching.Cache
+        The cache the function is memoized in.
+    folder : str
+        The folder for the lock files shared between processes.
+    registry : Source_Registry, optional
+        A registry to record the source files of each new entry in.
+    sources : function, optional
+        A function that takes the same arguments as the memoized function
+        and returns the paths to the files its entry is built from.
+
+    Returns
+    -------
+    function
+        A decorator for a function returned by cache.memoize. Calls that
+        miss take a lock on their arguments, so the first one computes the
+        entry and the others read it once the lock is released. Hits,
+        misses, and their times are recorded in the backend's metrics, if
+        it has them. If there is a registry, entries built from files that
+        have changed since are deleted first.
+    """
+    def decorator(function):
+        name = f"{function.__module__}.{function.__qualname__}"
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            paths = []
+            if registry is not None and sources is not None:
+                paths = [p for p in sources(*args, **kwargs) if p]
+                registry.check(paths)
+
+            try:
+                key = function.make_cache_key(function.uncached, *args,
+                                              **kwargs)
+                cached = cache.cache.has(key)
+            except Exception:
+                logging.warning("Could not find the cache key for %s",
+                                name, exc_info=True)
+                return function(*args, **kwargs)
+
+            if cached:
+                value = function(*args, **kwargs)
+            else:
+                # The memoized key includes a function version that can
+                # change while the first call is computing, so lock on the
+                # arguments
+                flight = repr((name, args, sorted(kwargs.items())))
+                with Flight(flight, folder):
+                    value = function(*args, **kwargs)
+                if paths:
+                    registry.register(cache, key, paths)
+
+            metrics = getattr(cache.cache, "metrics", None)
+            if metrics is not None:
+                size = None
+                if not cached:
+                    size = cache.cache.entry_size(key)
+                metrics.record(name, cached, perf_counter() - start, size)
+
+            return value
+
+        return wrapper
+    return decorator
+
+
+def to_arrow(df, dictionary=False):
+    """Convert a data frame to an Arrow table, keeping float NaNs as values.
+
+    Arrow would otherwise turn NaNs into nulls, and reading a column with
+    nulls back into pandas requires a copy.
+
+    Parameters
+    ----------
+    df : pd.core.frame.DataFrame
+        The table to convert.
+    dictionary : bool
+        Dictionary encode string columns with many repeated values. The
+        names of these columns are listed in the schema metadata so
+        from_arrow can decode them.
+
+    Returns
+    -------
+    pa.lib.Table
+        The converted table.
+    """
+    table = pa.Table.from_pandas(df)
+    encoded = []
+    for i, name in enumerate(table.schema.names):
+        field = table.schema.field(i)
+        if name in df.columns and df[name].dtype.kind == "f":
+            values = df[name]
+            if isinstance(values, pd.Series):
+                array = pa.array(values.to_numpy(), from_pandas=False)
+                table = table.set_column(i, field, array)
+        elif dictionary and (pa.types.is_string(field.type)
+                             or pa.types.is_large_string(field.type)):
+            array = table.column(i).combine_chunks().dictionary_encode()
+            if 2 * len(array.dictionary) <= len(array):
+                table = table.set_column(i, name, array)
+                encoded.append(name)
+
+    metadata = dict(table.schema.metadata or {})
+    metadata[METADATA] = json.dumps({"dictionary": encoded}).encode()
+    return table.replace_schema_metadata(metadata)
+
+
+def value_size(value, default=0):
+    """Return the approximate size of a cache entry in memory (bytes).
+
+    Data frames, and containers of them, are measured, and anything else
+    is assumed to take the default, e.g. the size of its cache file.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, dict):
+        if any(isinstance(v, pd.DataFrame) for v in value.values()):
+            return sum(value_size(v) for v in value.values())
+    return default
+
+
+class Arrow_Serializer:
+    """Write data frames to cache files as Arrow IPC files."""
+
+    kind = ARROW
+
+    def __init__(self, compression=None, dictionary=False):
+        """Initialize Arrow_Serializer object.
+
+        Parameters
+        ----------
+        compression : str, optional
+            "lz4" or "zstd". The default of None writes uncompressed files
+            that can be memory-mapped.
+        dictionary : bool
+            Dictionary encode string columns with many repeated values.
+        """
+        self.compression = compression
+        self.dictionary = dictionary
+
+    def __repr__(self):
+        """Return representation string for Arrow_Serializer object."""
+        return (f"<Arrow_Serializer: compression={self.compression}, "
+                f"dictionary={self.dictionary}>")
+
+    @property
+    def mappable(self):
+        """Return True if written tables can be shared by memory-mapping."""
+        return self.compression is None
+
+    def prepare(self, value):
+        """Convert a data frame to an Arrow table, or raise a TypeError."""
+        if pa is None or not isinstance(value, pd.DataFrame):
+            raise TypeError("Only data frames can be written as Arrow.")
+        return to_arrow(value, dictionary=self.dictionary)
+
+    def write(self, table, file):
+        """Write a prepared table to an open file."""
+        options = pa.ipc.IpcWriteOptions(compression=self.compression)
+        with pa.ipc.new_file(file, table.schema, options=options) as writer:
+            writer.write_table(table)
+
+
+class Cache_Metrics:
+    """Counts of what one cache backend has done in this process."""
+
+    COUNTERS = ["hits", "misses", "memory_hits", "sets", "bytes_read",
+                "bytes_written", "memory_evictions", "disk_evictions",
+                "disk_evicted_bytes"]
+    FUNCTION_COUNTERS = ["hits", "misses", "hit_seconds", "miss_seconds",
+                         "max_miss_seconds", "entry_bytes",
+                         "max_entry_bytes"]
+
+    def __init__(self):
+        """Initialize Cache_Metrics object."""
+        self._lock = threading.Lock()
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.functions = {}
+        self.started = time()
+
+    def __repr__(self):
+        """Return representation string for Cache_Metrics object."""
+        hits = self.counters["hits"]
+        misses = self.counters["misses"]
+        return f"<Cache_Metrics: {hits} hits, {misses} misses>"
+
+    def count(self, counter, value=1):
+        """Add to one of the backend counters."""
+        with self._lock:
+            self.counters[counter] += value
+
+    def record(self, function, hit, seconds, size=None):
+        """Record one call of a memoized function.
+
+        Parameters
+        ----------
+        function : str
+            The full name of the function.
+        hit : bool
+            Whether the entry was already in the cache.
+        seconds : float
+            The time the call took, including any time spent waiting for
+            another call to compute the entry.
+        size : int, optional
+            The size of the entry written on a miss (bytes).
+        """
+        with self._lock:
+            entry = self.functions.get(function)
+            if entry is None:
+                entry = dict.fromkeys(self.FUNCTION_COUNTERS, 0)
+                self.functions[function] = entry
+            if hit:
+                entry["hits"] += 1
+                entry["hit_seconds"] += seconds
+            else:
+                entry["misses"] += 1
+                entry["miss_seconds"] += seconds
+                entry["max_miss_seconds"] = max(entry["max_miss_seconds"],
+                                                seconds)
+                if size:
+                    entry["entry_bytes"] += size
+                    entry["max_entry_bytes"] = max(entry["max_entry_bytes"],
+                                                   size)
+
+        if not hit:
+            logging.info("Cache miss for %s took %.3f s (%s bytes)", function,
+                         seconds, size)
+
+    def to_dict(self):
+        """Return a copy of the counts."""
+        with self._lock:
+            return {
+                "started": self.started,
+                "pid": os.getpid(),
+                "counters": dict(self.counters),
+                "functions": {k: dict(v) for k, v in self.functions.items()}
+            }
+
+
+class Flight:
+    """A lock on one cache key across threads and processes."""
+
+    _guard = threading.Lock()
+    _locks = {}
+
+    def __init__(self, key, folder=LOCK_FOLDER):
+        """Initialize Flight object.
+
+        Parameters
+        ----------
+        key : str
+            The cache key to lock.
+        folder : str
+            The folder for the lock files shared between processes.
+        """
+        self.name = hashlib.sha256(str(key).encode()).hexdigest()[:32]
+        self.folder = folder
+        self._file = None
+
+    def __enter__(self):
+        """Wait for the lock in this process, then in others."""
+        with self._guard:
+            lock, users = self._locks.get(self.name, (threading.Lock(), 0))
+            self._locks[self.name] = (lock, users + 1)
+        lock.acquire()
+
+        if fcntl is not None:
+            try:
+                os.makedirs(self.folder, exist_ok=True)
+                path = os.path.join(self.folder, self.name + ".lock")
+                self._file = open(path, "a")
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            except OSError:
+                logging.warning("Could not lock cache key in '%s'",
+                                self.folder, exc_info=True)
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+
+        return self
+
+    def __exit__(self, *args):
+        """Release the lock in other processes, then in this one."""
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+        with self._guard:
+            lock, users = self._locks[self.name]
+            if users == 1:
+                del self._locks[self.name]
+            else:
+                self._locks[self.name] = (lock, users - 1)
+        lock.release()
+
+
+class Pickle_Serializer:
+    """Write any object to cache files with pickle."""
+
+    kind = PICKLE
+    mappable = False
+
+    def __repr__(self):
+        """Return representation string for Pickle_Serializer object."""
+        return "<Pickle_Serializer>"
+
+    def prepare(self, value):
+        """Return the value as is."""
+        return value
+
+    def write(self, value, file):
+        """Pickle a value to an open file."""
+        pickle.dump(value, file, pickle.HIGHEST_PROTOCOL)
+
+
+PICKLER = Pickle_Serializer()
+SERIALIZERS = {
+    "arrow": Arrow_Serializer(),
+    "arrow_lz4": Arrow_Serializer("lz4", dictionary=True),
+    "arrow_zstd": Arrow_Serializer("zstd", dictionary=True),
+    "pickle": PICKLER
+}
+
+
+class Source_Registry:
+    """Which cache entries were built from which source files.
+
+    Each source file has a small JSON record in the registry folder with
+    its fingerprint when its entries were registered and the cache name
+    and key of each entry. Entries derived from other entries (e.g. map
+    data from a table) are registered against the same files, so a change
+    to a file invalidates everything built from it, and nothing else.
+    """
+
+    def __init__(self, folder, caches):
+        """Initialize Source_Registry object.
+
+        Parameters
+        ----------
+        folder : str
+            The folder for the source records.
+        caches : dict
+            The flask_caching.Cache objects that entries are kept in, keyed
+            by name.
+        """
+        self.folder = os.path.abspath(os.path.expanduser(folder))
+        self.caches = caches
+        self._fingerprints = {}
+        os.makedirs(self.folder, exist_ok=True)
+
+    def __repr__(self):
+        """Return representation string for Source_Registry object."""
+        return f"<Source_Registry: {self.folder}>"
+
+    def check(self, paths):
+        """Invalidate the entries of any source files that have changed.
+
+        Parameters
+        ----------
+        paths : list
+            Paths to source files.
+
+        Returns
+        -------
+        list
+            The paths that had changed.
+        """
+        changed = []
+        for path in paths:
+            fprint = self._fingerprint(path)
+            if self._fingerprints.get(path) == fprint:
+                continue
+            with Flight(("source", path), self.folder):
+                record = self._read(path)
+                if record["fingerprint"] not in (None, fprint):
+                    self._delete(record["entries"])
+                    record = {"path": path, "fingerprint": fprint,
+                              "entries": []}
+                    self._write(path, record)
+                    changed.append(path)
+            self._fingerprints[path] = fprint
+        return changed
+
+    def invalidate(self, path):
+        """Delete every entry built from a source file, changed or not."""
+        with Flight(("source", path), self.folder):
+            record = self._read(path)
+            self._delete(record["entries"])
+            record["entries"] = []
+            self._write(path, record)
+
+    def register(self, cache, key, paths):
+        """Record that a cache entry was built from some source files.
+
+        Parameters
+        ----------
+        cache : flask_caching.Cache
+            One of the registry's caches.
+        key : str
+            The entry's key.
+        paths : list
+            Paths to the source files it was built from.
+        """
+        names = [n for n, c in self.caches.items() if c is cache]
+        if not names:
+            return
+        entry = [names[0], key]
+        for path in paths:
+            fprint = self._fingerprint(path)
+            with Flight(("source", path), self.folder):
+                record = self._read(path)
+                if record["fingerprint"] != fprint:
+                    self._delete(record["entries"])
+                    record = {"path": path, "fingerprint": fprint,
+                              "entries": []}
+                if entry not in record["entries"]:
+                    record["entries"].append(entry)
+                self._write(path, record)
+            self._fingerprints[path] = fprint
+
+    def _delete(self, entries):
+        """Delete entries from their caches."""
+        for name, key in entries:
+            if name in self.caches:
+                try:
+                    self.caches[name].delete(key)
+                except Exception:
+                    logging.warning("Could not delete cache entry %s from "
+                                    "%s", key, name, exc_info=True)
+
+    def _fingerprint(self, path):
+        """Return the fingerprint of a source file, or None if it's gone."""
+        try:
+            return fingerprint_key(path)
+        except OSError:
+            return None
+
+    def _path(self, path):
+        """Return the path to the record of a source file."""
+        name = hashlib.md5(os.path.abspath(path).encode()).hexdigest()
+        return os.path.join(self.folder, name + ".json")
+
+    def _read(self, path):
+        """Read the record of a source file."""
+        try:
+            with open(self._path(path), "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {"path": path, "fingerprint": None, "entries": []}
+
+    def _write(self, path, record):
+        """Write the record of a source file."""
+        dst = self._path(path)
+        tmp = f"{dst}.{os.getpid()}.tmp"
+        with open(tmp, "w") as file:
+            json.dump(record, file)
+        os.replace(tmp, dst)
+
+
+class TablePool(FileSystemCache):
+    """A filesystem cache that memory-maps data frames across processes.
+
+    Data frames it returns share their values with the cache and must be
+    treated as read-only (see share_value).
+    """
+
+    def __init__(self, *args, memory_limit=0, disk_limit=0,
+                 table_format="arrow", **kwargs):
+        """Initialize TablePool object (see FileSystemCache).
+
+        Parameters
+        ----------
+        memory_limit : int
+            The most bytes of live entries to keep in this process. The
+            default of 0 keeps none.
+        disk_limit : int
+            The most bytes of cache files to keep on disk. The default of 0
+            only uses the entry count threshold.
+        table_format : str | Arrow_Serializer | Pickle_Serializer
+            How to write data frames, either the name of one of the
+            SERIALIZERS or a serializer object. Everything else is pickled.
+        """
+        self._tables = {}
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._memory_lock = threading.Lock()
+        self._disk_bytes = None
+        self._disk_sets = 0
+        self.metrics = Cache_Metrics()
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        if isinstance(table_format, str):
+            table_format = SERIALIZERS[table_format]
+        if pa is None:
+            table_format = PICKLER
+        self.table_format = table_format
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        """Create a TablePool from a flask-caching config."""
+        kwargs.update(memory_limit=config.get("CACHE_MEMORY_LIMIT", 0),
+                      disk_limit=config.get("CACHE_DISK_LIMIT", 0),
+                      table_format=config.get("CACHE_TABLE_FORMAT", "arrow"))
+        return super().factory(app, config, args, kwargs)
+
+    def get(self, key):
+        """Return the entry for a key, memory-mapping data frames."""
+        filename = self._get_filename(key)
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            self._forget(filename)
+            self._count(key, "misses")
+            return None
+
+        # An entry already live in this process
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._memory_lock:
+            entry = self._memory.get(filename)
+            if entry is not None and entry[0] == signature:
+                self._memory.move_to_end(filename)
+        if entry is not None:
+            msignature, expires, value, _ = entry
+            if msignature == signature:
+                if expires != 0 and expires < time():
+                    self._count(key, "misses")
+                    return None
+                self._touch(filename, stat)
+                self._count(key, "hits")
+                self._count(key, "memory_hits")
+                return share_value(value)
+            self._forget(filename)
+
+        value = self._read(filename, signature)
+        if value is None:
+            self._count(key, "misses")
+        else:
+            self._touch(filename, stat)
+            self._count(key, "hits")
+            self._count(key, "bytes_read", stat.st_size)
+        return value
+
+    def delete(self, key, mgmt_element=False):
+        """Delete an entry, keeping the running size of the folder."""
+        size = self.entry_size(key)
+        deleted = super().delete(key, mgmt_element=mgmt_element)
+        if deleted and size and not mgmt_element:
+            if self._disk_bytes is not None:
+                self._disk_bytes -= size
+        return deleted
+
+    def entry_size(self, key):
+        """Return the size of the cache file for a key (bytes)."""
+        try:
+            return os.path.getsize(self._get_filename(key))
+        except OSError:
+            return None
+
+    def set(self, key, value, timeout=None, mgmt_element=False):
+        """Store an entry, writing data frames in the table format."""
+        # Management elements have no timeout
+        if mgmt_element:
+            timeout = 0
+        else:
+            self._prune()
+
+        expires = self._normalize_timeout(timeout)
+        filename = self._get_filename(key)
+        try:
+            old_size = os.path.getsize(filename)
+            overwrite = True
+        except OSError:
+            old_size = 0
+            overwrite = False
+
+        # Fall back to pickle for anything the serializer can't write
+        serializer = self.table_format
+        try:
+            payload = serializer.prepare(value)
+        except (TypeError, ValueError, NotImplementedError):
+            serializer = PICKLER
+            payload = value
+
+        try:
+            fd, tmp = tempfile.mkstemp(suffix=self._fs_transaction_suffix,
+                                       dir=self._path)
+            with os.fdopen(fd, "wb") as file:
+                file.write(HEADER.pack(expires, serializer.kind))
+                serializer.write(payload, file)
+            os.replace(tmp, filename)
+            os.chmod(filename, self._mode)
+        except OSError:
+            logging.warning("Exception raised while handling cache file '%s'",
+                            filename, exc_info=True)
+            return False
+
+        self._forget(filename)
+        size = os.path.getsize(filename)
+        if not mgmt_element:
+            if self._disk_bytes is not None:
+                self._disk_bytes += size - old_size
+            self._disk_sets += 1
+            self._count(key, "sets")
+            self._count(key, "bytes_written", size)
+        if self.memory_limit and not mgmt_element:
+            # The caller keeps the value it set, so keep a private copy
+            stat = os.stat(filename)
+            signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._remember(filename, signature, expires, copy_value(value))
+        if not overwrite and not mgmt_element:
+            self._update_count(delta=1)
+        return True
+
+    def stats(self):
+        """Return this process's metrics and the current size of each tier.
+
+        Returns
+        -------
+        dict
+            The Cache_Metrics counts, plus the bytes and number of entries
+            in this process's memory tier and in the cache folder.
+        """
+        stats = self.metrics.to_dict()
+        with self._memory_lock:
+            stats["memory_bytes"] = self._memory_bytes
+            stats["memory_entries"] = len(self._memory)
+        sizes = []
+        for filename in self._list_dir():
+            try:
+                sizes.append(os.path.getsize(filename))
+            except OSError:
+                pass
+        stats["disk_bytes"] = sum(sizes)
+        stats["disk_entries"] = len(sizes)
+        return stats
+
+    def _count(self, key, counter, value=1):
+        """Add to a counter, except for the cache's own bookkeeping keys
+        (the entry count and memoized function versions)."""
+        if key == self._fs_count_file or key.endswith("_memver"):
+            return
+        self.metrics.count(counter, value)
+
+    def _forget(self, filename):
+        """Drop the in-process copies of a cache file."""
+        self._tables.pop(filename, None)
+        with self._memory_lock:
+            entry = self._memory.pop(filename, None)
+            if entry is not None:
+                self._memory_bytes -= entry[3]
+
+    def _map(self, filename):
+        """Memory-map the Arrow payload of a cache file."""
+        source = pa.memory_map(filename, "r")
+        source.seek(HEADER.size)
+        return pa.ipc.open_file(source.read_buffer()).read_all()
+
+    def _prune(self):
+        """Prune the cache folder and unmap tables that were removed."""
+        super()._prune()
+        if self.disk_limit and self._over_budget():
+            self._prune_bytes()
+        for filename in list(self._tables):
+            if not os.path.exists(filename):
+                self._forget(filename)
+        with self._memory_lock:
+            filenames = list(self._memory)
+        for filename in filenames:
+            if not os.path.exists(filename):
+                self._forget(filename)
+
+    def _over_budget(self):
+        """Check whether the cache folder might be over the disk budget.
+
+        The folder's size is kept as entries are written and deleted here
+        and only rescanned when that passes the budget, or every
+        DISK_SCAN_INTERVAL sets to count other processes' entries.
+        """
+        if self._disk_bytes is None or self._disk_sets >= DISK_SCAN_INTERVAL:
+            return True
+        return self._disk_bytes > self.disk_limit
+
+    def _prune_bytes(self):
+        """Remove expired, then least recently used, files over the disk
+        budget."""
+        now = time()
+        entries = []
+        for filename in self._list_dir():
+            try:
+                stat = os.stat(filename)
+                with open(filename, "rb") as file:
+                    expires = struct.unpack("I", file.read(4))[0]
+            except (OSError, struct.error):
+                continue
+            expired = expires != 0 and expires < now
+            entries.append((not expired, stat.st_atime, stat.st_size,
+                            filename))
+
+        # Once over budget, make some room so the next few sets don't each
+        # trigger a rescan
+        total = sum(entry[2] for entry in entries)
+        target = self.disk_limit * DISK_PRUNE_TARGET
+        if total <= self.disk_limit:
+            entries = []
+        for _, _, size, filename in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                logging.warning("Exception raised while handling cache "
+                                "file '%s'", filename, exc_info=True)
+                continue
+            total -= size
+            self._update_count(delta=-1)
+            self._forget(filename)
+            self.metrics.count("disk_evictions")
+            self.metrics.count("disk_evicted_bytes", size)
+
+        self._disk_bytes = total
+        self._disk_sets = 0
+
+    def _read(self, filename, signature):
+        """Read a cache file, keeping what it needs to in this process."""
+        mapped = self._tables.get(filename)
+        if mapped is not None:
+            msignature, expires, table = mapped
+            if msignature == signature:
+                if expires != 0 and expires < time():
+                    return None
+                value = from_arrow(table)
+                self._remember(filename, signature, expires, value)
+                return share_value(value)
+            self._tables.pop(filename, None)
+
+        try:
+            with open(filename, "rb") as file:
+                expires, kind = HEADER.unpack(file.read(HEADER.size))
+                if expires != 0 and expires < time():
+                    return None
+                if kind == ARROW:
+                    table = self._map(filename)
+                    if self.table_format.mappable:
+                        self._tables[filename] = (signature, expires, table)
+                    value = from_arrow(table)
+                else:
+                    if kind != PICKLE:
+                        # Written by the standard filesystem backend
+                        file.seek(4)
+                    value = pickle.load(file)
+        except (OSError, EOFError, struct.error, pickle.UnpicklingError):
+            logging.warning("Exception raised while handling cache file '%s'",
+                            filename, exc_info=True)
+            return None
+
+        self._remember(filename, signature, expires, value)
+        return share_value(value)
+
+    def _remember(self, filename, signature, expires, value):
+        """Keep a live entry, dropping the least recently used ones.
+
+        Returns True if the entry was kept.
+        """
+        if not self.memory_limit:
+            return False
+        size = value_size(value, signature[2])
+        if not self.memory_limit or size > self.memory_limit:
+            return False
+        with self._memory_lock:
+            entry = self._memory.pop(filename, None)
+            if entry is not None:
+                self._memory_bytes -= entry[3]
+            self._memory[filename] = (signature, expires, value, size)
+            self._memory_bytes += size
+            while self._memory_bytes > self.memory_limit:
+                _, entry = self._memory.popitem(last=False)
+                self._memory_bytes -= entry[3]
+                self.metrics.count("memory_evictions")
+        return True
+
+    def _touch(self, filename, stat):
+        """Mark a cache file as recently used for the disk budget."""
+        if not self.disk_limit:
+            return
+        if time() - stat.st_atime < TOUCH_INTERVAL:
+            return
+        try:
+            os.utime(filename, ns=(int(time() * 1e9), stat.st_mtime_ns))
+        except OSError:
+            pass
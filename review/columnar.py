@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""Columnar sidecar files for supply-curve tables.
+
+Parsing a full supply-curve csv is the slowest part of building a map. The
+first read of a table writes an Arrow IPC (Feather v2) copy of it into a
+hidden folder next to the csv, and every read after that pulls only the
+requested columns from the copy. Sidecars are keyed on the csv's path,
+modification time, and size, so a regenerated csv is simply re-converted.
+
+Pre-convert a whole project with:
+
+    python -m review.columnar "Transition"
+
+Created on Sun Oct 18 09:12:40 2026
+
+@author: twillia2
+"""
+import hashlib
+import os
+import warnings
+
+from glob import escape, glob
+
+import click
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+
+
+SIDECAR_FOLDER = ".review_sidecars"
+SIDECAR_HOME = os.path.expanduser("~/.review_sidecars")
+
+# Sidecars that couldn't be written, whose tables are read from the csv
+_FAILED = set()
+
+
+def fingerprint(path):
+    """Return the identifying attributes of a source file.
+
+    Parameters
+    ----------
+    path : str
+        Path to a source file.
+
+    Returns
+    -------
+    dict
+        The absolute path, modification time (ns), and size (bytes) of the
+        file.
+    """
+    path = os.path.abspath(os.path.expanduser(path))
+    stat = os.stat(path)
+    return {"path": path, "mtime": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def fingerprint_key(path):
+    """Return a short hash of a source file's fingerprint."""
+    fprint = fingerprint(path)
+    string = "{path}:{mtime}:{size}".format(**fprint)
+    return hashlib.md5(string.encode()).hexdigest()[:16]
+
+
+def sidecar_folder(path):
+    """Return a writable folder for the sidecars of a source file."""
+    folder = os.path.join(os.path.dirname(os.path.abspath(path)),
+                          SIDECAR_FOLDER)
+    try:
+        os.makedirs(folder, exist_ok=True)
+    except OSError:
+        folder = SIDECAR_HOME
+        os.makedirs(folder, exist_ok=True)
+    if not os.access(folder, os.W_OK):
+        folder = SIDECAR_HOME
+        os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def sidecar_name(path):
+    """Return the sidecar name prefix shared by all versions of a source file.
+
+    The name includes a short hash of the source folder, so sidecars of
+    same-named files in different folders don't collide in SIDECAR_HOME.
+    """
+    folder = os.path.dirname(os.path.abspath(os.path.expanduser(path)))
+    folder_key = hashlib.md5(folder.encode()).hexdigest()[:8]
+    return f"{os.path.basename(path)}.{folder_key}"
+
+
+def sidecar_path(path):
+    """Return the sidecar path for the current version of a source file."""
+    fname = f"{sidecar_name(path)}.{fingerprint_key(path)}.feather"
+    return os.path.join(sidecar_folder(path), fname)
+
+
+def columns(path):
+    """Return the column names of a supply-curve table.
+
+    Parameters
+    ----------
+    path : str
+        Path to a supply-curve csv.
+
+    Returns
+    -------
+    list
+        All column names in the order they appear in the csv.
+    """
+    if pa is not None:
+        sidecar = sidecar_path(path)
+        if os.path.exists(sidecar):
+            with pa.memory_map(sidecar, "r") as source:
+                names = pa.ipc.open_file(source).schema.names
+            return [n for n in names if not n.startswith("__index_level")]
+    return pd.read_csv(path, nrows=0).columns.tolist()
+
+
+def schema(path):
+    """Return an empty data frame with a supply-curve table's columns.
+
+    Parameters
+    ----------
+    path : str
+        Path to a supply-curve csv.
+
+    Returns
+    -------
+    pd.core.frame.DataFrame
+        A table with no rows and the same columns and types as the full
+        table read with read_table.
+    """
+    if pa is not None:
+        sidecar = sidecar_path(path)
+        if os.path.exists(sidecar):
+            with pa.memory_map(sidecar, "r") as source:
+                table = pa.ipc.open_file(source).schema.empty_table()
+            return table.to_pandas()
+    return read_table(path).iloc[:0]
+
+
+def read_table(path, columns=None):
+    """Read a supply-curve table through its columnar sidecar.
+
+    Parameters
+    ----------
+    path : str
+        Path to a supply-curve csv.
+    columns : list, optional
+        Columns to read. The default of None reads all of them.
+
+    Returns
+    -------
+    pd.core.frame.DataFrame
+        The requested columns of the table, in the order requested.
+    """
+    if pa is None:
+        return read_csv(path, columns)
+
+    try:
+        sidecar = sidecar_path(path)
+    except OSError as error:
+        warnings.warn(f"No writable sidecar folder for {path}: {error}")
+        return read_csv(path, columns)
+    if sidecar in _FAILED:
+        return read_csv(path, columns)
+    if os.path.exists(sidecar):
+        return pd.read_feather(sidecar, columns=columns)
+
+    df = pd.read_csv(path, low_memory=False)
+    write_sidecar(df, path)
+    if columns is not None:
+        df = df[list(columns)]
+    return df
+
+
+def read_csv(path, columns=None):
+    """Read the requested columns of a supply-curve csv, in that order."""
+    df = pd.read_csv(path, usecols=columns, low_memory=False)
+    if columns is not None:
+        df = df[list(columns)]
+    return df
+
+
+def write_sidecar(df, path):
+    """Write a table to the sidecar of its source file and remove old ones.
+
+    Parameters
+    ----------
+    df : pd.core.frame.DataFrame
+        The full table read from path.
+    path : str
+        Path to the source csv.
+
+    Returns
+    -------
+    str | None
+        Path to the new sidecar, or None if the table can't be stored in
+        Arrow format (e.g. mixed types in a single column).
+    """
+    if pa is None:
+        return None
+
+    sidecar = sidecar_path(path)
+    tmp = f"{sidecar}.{os.getpid()}.tmp"
+    try:
+        # Uncompressed so the sidecar can be memory-mapped
+        feather.write_feather(df, tmp, compression="uncompressed")
+        os.replace(tmp, sidecar)
+    except (pa.ArrowException, OSError, TypeError, ValueError) as error:
+        warnings.warn(f"Could not write sidecar for {path}, reading the csv "
+                      f"instead: {error}")
+        _FAILED.add(sidecar)
+        if os.path.exists(tmp):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+        return None
+
+    # Remove sidecars of older versions of this file
+    pattern = os.path.join(os.path.dirname(sidecar),
+                           escape(sidecar_name(path)) + ".*.feather")
+    for old in glob(pattern):
+        if old != sidecar:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    return sidecar
+
+
+def convert(path, overwrite=False):
+    """Write the sidecar for a single supply-curve csv.
+
+    Parameters
+    ----------
+    path : str
+        Path to a supply-curve csv.
+    overwrite : bool
+        Rewrite the sidecar even if a current one exists.
+
+    Returns
+    -------
+    str | None
+        Path to the sidecar.
+    """
+    sidecar = sidecar_path(path)
+    if os.path.exists(sidecar) and not overwrite:
+        return sidecar
+    df = pd.read_csv(path, low_memory=False)
+    return write_sidecar(df, path)
+
+
+@click.command()
+@click.argument("project")
+@click.option("--overwrite", is_flag=True,
+              help="Rewrite sidecars even if they are current.")
+@click.option("--workers", default=None, type=int,
+              help="Number of processes to use (defaults to all cores).")
+def main(project, overwrite, workers):
+    """Pre-convert every supply-curve table in a reView PROJECT."""
+    from pathos import multiprocessing as mp
+    from review.support import Config
+    from tqdm import tqdm
+
+    if pa is None:
+        raise click.ClickException("pyarrow is required to write sidecars.")
+
+    config = Config(project)
+    paths = list(config.files.values())
+    if not workers:
+        workers = mp.cpu_count()
+
+    def _convert(path):
+        return convert(path, overwrite=overwrite)
+
+    with mp.Pool(workers) as pool:
+        for _ in tqdm(pool.imap(_convert, paths), total=len(paths)):
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,477 @@
+# -*- coding: utf-8 -*-
+"""Stacked scenario arrays for a reView project.
+
+Least cost, differences, and scenario comparisons all need the same values
+from every scenario lined up by sc_point_gid. A scenario cube stores each
+variable of a project as a single (scenario x sc_point_gid) numpy array in a
+hidden folder next to the project's tables, so these become memory-mapped
+array reductions instead of re-reading and realigning every csv. Numeric
+variables are stored as floats with NaN for missing points, and everything
+else as integer category codes with -1 for missing points.
+
+Scenario rows are rewritten when their tables change, and the whole cube is
+rebuilt if the set of scenarios or points changes. Build or update a
+project's cube with:
+
+    python -m review.cube "Transition"
+
+Created on Sun Oct 18 16:20:41 2026
+
+@author: twillia2
+"""
+import json
+import os
+import warnings
+
+import click
+import numpy as np
+import pandas as pd
+
+from review import columnar
+
+
+CUBE_FOLDER = ".review_cube"
+EXTRA_VARIABLES = ["capacity", "n_gids"]
+
+
+class Scenario_Cube:
+    """Dense (scenario x sc_point_gid) arrays for each project variable."""
+
+    def __init__(self, project, folder=None):
+        """Initialize Scenario_Cube object.
+
+        Parameters
+        ----------
+        project : str
+            The reView project name.
+        folder : str, optional
+            Where to store the cube. Defaults to a hidden folder in the
+            project directory.
+        """
+        from review.support import Config
+
+        self.project = project
+        self.config = Config(project)
+        if folder is None:
+            folder = os.path.join(self.config.directory, CUBE_FOLDER)
+        self.folder = folder
+        self._arrays = {}
+
+    def __repr__(self):
+        """Print representation string."""
+        manifest = self.manifest
+        msg = (f"<reView Scenario_Cube object: project='{self.project}', "
+               f"{len(manifest.get('scenarios', []))} scenarios, "
+               f"{len(manifest.get('variables', {}))} variables>")
+        return msg
+
+    @property
+    def gids(self):
+        """Return the sorted sc_point_gids of the cube's columns."""
+        return np.load(os.path.join(self.folder, "gids.npy"), mmap_mode="r")
+
+    @property
+    def groups(self):
+        """Return the project's group metadata, one row per scenario."""
+        groups = pd.DataFrame(self.manifest["groups"])
+        groups.index = self.scenarios
+        return groups
+
+    @property
+    def manifest(self):
+        """Return the cube's manifest."""
+        try:
+            with open(os.path.join(self.folder, "manifest.json")) as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            manifest = {}
+        return manifest
+
+    @property
+    def scenarios(self):
+        """Return the scenario names of the cube's rows."""
+        return list(self.manifest["scenarios"])
+
+    @property
+    def stale(self):
+        """Return the scenarios whose tables changed since they were stored.
+
+        Returns
+        -------
+        list | None
+            Stale scenario names, including those whose tables are missing,
+            or None if the cube has to be rebuilt because it's missing or the
+            project's scenarios changed.
+        """
+        manifest = self.manifest
+        files = self.config.files
+        if not manifest or manifest["scenarios"] != list(files) or \
+                manifest["wanted"] != self._wanted:
+            return None
+        stale = []
+        for scenario, path in files.items():
+            try:
+                fprint = columnar.fingerprint(path)
+            except OSError:
+                fprint = None
+            if manifest["files"][scenario] != fprint:
+                stale.append(scenario)
+        return stale
+
+    @property
+    def variables(self):
+        """Return the variables stored in the cube."""
+        return list(self.manifest["variables"])
+
+    def array(self, variable):
+        """Return the memory-mapped (scenario x gid) array of a variable.
+
+        Parameters
+        ----------
+        variable : str
+            A variable stored in the cube.
+
+        Returns
+        -------
+        np.memmap
+            Floats for numeric variables, category codes for others.
+        """
+        path = self._path(variable)
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if variable not in self._arrays or \
+                self._arrays[variable][0] != signature:
+            array = np.load(path, mmap_mode="r")
+            self._arrays[variable] = (signature, array)
+        return self._arrays[variable][1]
+
+    def build(self, overwrite=False):
+        """Build the cube, or update the rows of changed scenarios.
+
+        Parameters
+        ----------
+        overwrite : bool
+            Rebuild the whole cube even if it's current.
+
+        Returns
+        -------
+        list
+            The scenarios that were (re)written.
+        """
+        files = self.config.files
+        stale = None if overwrite else self.stale
+        if stale is not None and not stale:
+            return []
+
+        # Rows can only be replaced in place if the points and categories
+        # haven't changed
+        manifest = self.manifest
+        if stale is not None:
+            gids = np.asarray(self.gids)
+            for scenario in stale:
+                if not self._fits(files[scenario], gids, manifest):
+                    stale = None
+                    break
+
+        if stale is None:
+            return self._create(files)
+
+        for scenario in stale:
+            row = manifest["scenarios"].index(scenario)
+            manifest["files"][scenario] = columnar.fingerprint(
+                files[scenario]
+            )
+            self._write_row(row, files[scenario], gids,
+                            manifest["variables"])
+        self._write_manifest(manifest)
+
+        return stale
+
+    def frame(self, variable, scenarios=None):
+        """Return a variable as a data frame of gids by scenarios.
+
+        Parameters
+        ----------
+        variable : str
+            A variable stored in the cube.
+        scenarios : list, optional
+            Scenarios to include. Defaults to all of them.
+
+        Returns
+        -------
+        pd.core.frame.DataFrame
+            One column per scenario, indexed by sc_point_gid. Category
+            variables are decoded.
+        """
+        rows, scenarios = self._rows(scenarios)
+        values = self.array(variable)[rows]
+        categories = self.manifest["variables"][variable]["categories"]
+        if categories is not None:
+            values = pd.Categorical.from_codes(values.ravel(), categories)
+            values = np.asarray(values).reshape(len(rows), -1)
+        df = pd.DataFrame(values.T, columns=scenarios,
+                          index=pd.Index(self.gids, name="sc_point_gid"))
+        return df
+
+    def difference(self, variable, scenario_a, scenario_b, units=None):
+        """Return the difference of a variable between two scenarios.
+
+        Parameters
+        ----------
+        variable : str
+            A numeric variable stored in the cube.
+        scenario_a : str
+            The scenario to difference from.
+        scenario_b : str
+            The scenario to difference against.
+        units : str, optional
+            Use "%" for percent differences (relative to scenario_b).
+
+        Returns
+        -------
+        pd.core.series.Series
+            Differences indexed by sc_point_gid.
+        """
+        rows, _ = self._rows([scenario_a, scenario_b])
+        array = self.array(variable)
+        diff = array[rows[0]] - array[rows[1]]
+        if units == "%":
+            with np.errstate(divide="ignore", invalid="ignore"):
+                diff = 100 * (diff / array[rows[1]])
+        return pd.Series(diff, name=variable,
+                         index=pd.Index(self.gids, name="sc_point_gid"))
+
+    def least_cost(self, by="total_lcoe", scenarios=None):
+        """Return the least cost scenario and value at each point.
+
+        Ties go to the earlier scenario, as in Least_Cost.
+
+        Parameters
+        ----------
+        by : str
+            The numeric variable to minimize.
+        scenarios : list, optional
+            Scenarios to choose from. Defaults to all of them.
+
+        Returns
+        -------
+        pd.core.frame.DataFrame
+            The winning "scenario" and its by value, indexed by
+            sc_point_gid, for points with at least one value.
+        """
+        rows, scenarios = self._rows(scenarios)
+        values = self.array(by)[rows]
+        valid = ~np.isnan(values).all(axis=0)
+        values = values[:, valid]
+        winners = np.nanargmin(values, axis=0)
+        df = pd.DataFrame({
+            "scenario": np.array(scenarios, dtype=object)[winners],
+            by: values[winners, np.arange(values.shape[1])]
+        }, index=pd.Index(np.asarray(self.gids)[valid], name="sc_point_gid"))
+        return df
+
+    def quantiles(self, variable, q, scenarios=None):
+        """Return quantiles of a variable across scenarios at each point.
+
+        Parameters
+        ----------
+        variable : str
+            A numeric variable stored in the cube.
+        q : float | list
+            Quantiles between 0 and 1.
+        scenarios : list, optional
+            Scenarios to include. Defaults to all of them.
+
+        Returns
+        -------
+        pd.core.frame.DataFrame
+            One column per quantile, indexed by sc_point_gid.
+        """
+        rows, _ = self._rows(scenarios)
+        q = np.atleast_1d(q)
+        with np.errstate(invalid="ignore"):
+            values = np.nanquantile(self.array(variable)[rows], q, axis=0)
+        return pd.DataFrame(values.T, columns=q,
+                            index=pd.Index(self.gids, name="sc_point_gid"))
+
+    def select(self, **groups):
+        """Return the scenarios matching values of the group metadata.
+
+        Parameters
+        ----------
+        **groups
+            Group names (the columns of project_config["data"]) and the
+            value or list of values to keep.
+
+        Returns
+        -------
+        list
+            Matching scenario names.
+        """
+        df = self.groups
+        for group, values in groups.items():
+            if not isinstance(values, (list, tuple, set)):
+                values = [values]
+            df = df[df[group].isin(values)]
+        return list(df.index)
+
+    def _create(self, files):
+        """Write a new cube for all of a project's scenarios."""
+        os.makedirs(self.folder, exist_ok=True)
+        scenarios = list(files)
+
+        # Collect the union of all points
+        gids = np.unique(np.concatenate([
+            self._read(path, ["sc_point_gid"])["sc_point_gid"].values
+            for path in files.values()
+        ]))
+        np.save(self._path("gids", "tmp"), gids)
+
+        # Find the variables and their types from the table schemas
+        variables = {}
+        for path in files.values():
+            schema = columnar.schema(path)
+            for variable in self._wanted:
+                if variable in schema.columns and variable not in variables:
+                    numeric = pd.api.types.is_numeric_dtype(schema[variable])
+                    variables[variable] = {"categories": None
+                                           if numeric else []}
+
+        # Category codes need the full set of categories up front
+        categorical = [v for v, i in variables.items()
+                       if i["categories"] is not None]
+        if categorical:
+            for path in files.values():
+                df = self._read(path, categorical)
+                for variable in df.columns:
+                    values = df[variable].dropna().astype(str).unique()
+                    categories = variables[variable]["categories"]
+                    categories.extend(sorted(set(values) - set(categories)))
+
+        manifest = {
+            "scenarios": scenarios,
+            "files": {s: columnar.fingerprint(p) for s, p in files.items()},
+            "variables": variables,
+            "wanted": self._wanted,
+            "groups": self.config.project_config["data"]
+        }
+
+        for variable, info in variables.items():
+            dtype = np.float64 if info["categories"] is None else np.int32
+            array = np.lib.format.open_memmap(
+                self._path(variable, "tmp"), mode="w+", dtype=dtype,
+                shape=(len(scenarios), gids.size)
+            )
+            del array
+
+        for row, path in enumerate(files.values()):
+            self._write_row(row, path, gids, variables, suffix="tmp")
+
+        # Swap the new arrays in
+        os.replace(self._path("gids", "tmp"), self._path("gids"))
+        for variable in variables:
+            os.replace(self._path(variable, "tmp"), self._path(variable))
+        self._write_manifest(manifest)
+        self._arrays = {}
+
+        return scenarios
+
+    def _fits(self, path, gids, manifest):
+        """Check if a table's points and categories are already in a cube."""
+        variables = manifest["variables"]
+        categorical = [v for v, i in variables.items()
+                       if i["categories"] is not None]
+        df = self._read(path, ["sc_point_gid"] + categorical)
+        if not np.isin(df["sc_point_gid"].values, gids).all():
+            return False
+        for variable in categorical:
+            if variable in df.columns:
+                values = df[variable].dropna().astype(str).unique()
+                if set(values) - set(variables[variable]["categories"]):
+                    return False
+        return True
+
+    def _path(self, variable, suffix=None):
+        """Return the path to a variable's array."""
+        fname = f"{variable}.npy"
+        if suffix:
+            fname = f"{variable}.{suffix}.npy"
+        return os.path.join(self.folder, fname)
+
+    def _read(self, path, columns):
+        """Read the available columns of a table."""
+        available = columnar.columns(path)
+        columns = [c for c in columns if c in available]
+        df = columnar.read_table(path, columns=columns)
+        if "sc_point_gid" in df.columns:
+            df = df[df["sc_point_gid"].notnull()]
+        return df
+
+    def _rows(self, scenarios):
+        """Return the row indices and names of scenarios."""
+        all_scenarios = self.scenarios
+        if scenarios is None:
+            scenarios = all_scenarios
+        rows = [all_scenarios.index(s) for s in scenarios]
+        return rows, list(scenarios)
+
+    def _write_manifest(self, manifest):
+        """Write the manifest."""
+        path = os.path.join(self.folder, "manifest.json")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as file:
+            json.dump(manifest, file, indent=4)
+        os.replace(tmp, path)
+
+    @property
+    def _wanted(self):
+        """Return the variables that should be stored for this project."""
+        return list(dict.fromkeys(list(self.config.units) + EXTRA_VARIABLES))
+
+    def _write_row(self, row, path, gids, variables, suffix=None):
+        """Write one scenario's values into each variable's array.
+
+        Only the first row of each sc_point_gid is stored.
+        """
+        df = self._read(path, ["sc_point_gid"] + list(variables))
+        unique, first = np.unique(df["sc_point_gid"].values,
+                                  return_index=True)
+        if unique.size < df.shape[0]:
+            warnings.warn(f"{path} has {df.shape[0] - unique.size} "
+                          "duplicate sc_point_gid rows, only the first row "
+                          "of each point is stored in the cube.")
+            df = df.iloc[np.sort(first)]
+        idx = np.searchsorted(gids, df["sc_point_gid"].values)
+
+        for variable, info in variables.items():
+            array = np.load(self._path(variable, suffix), mmap_mode="r+")
+            categories = info["categories"]
+            if categories is None:
+                array[row] = np.nan
+                if variable in df.columns:
+                    array[row, idx] = df[variable].values
+            else:
+                array[row] = -1
+                if variable in df.columns:
+                    values = df[variable].astype(str).where(
+                        df[variable].notnull()
+                    )
+                    codes = pd.Categorical(values, categories).codes
+                    array[row, idx] = codes
+            array.flush()
+            del array
+
+
+@click.command()
+@click.argument("project")
+@click.option("--overwrite", is_flag=True,
+              help="Rebuild the cube even if it is current.")
+def main(project, overwrite):
+    """Build or update the scenario cube of a reView PROJECT."""
+    cube = Scenario_Cube(project)
+    scenarios = cube.build(overwrite=overwrite)
+    print(f"{len(scenarios)} scenarios written to {cube.folder}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,17 @@ Created on Sat Aug 15 15:47:40 2020
 
 @author: travis
 """
+import hashlib
 import json
 import os
+import secrets
+import shutil
+import threading
 import time
+import warnings
 
 from collections import Counter
+from multiprocessing import resource_tracker, shared_memory
 from pathos import multiprocessing as mp
 
 import dash_core_components as dcc
@@ -22,7 +28,8 @@ import us
 
 from colorama import Style, Fore
 from revruns.rr import Data_Path
-from review import print_args
+from review import columnar, print_args
+from review.caching import Flight
 from tqdm import tqdm
 
 pd.set_option('mode.chained_assignment', None)
@@ -201,6 +208,7 @@ LCOEOPTIONS = [{"label": "Site-Based", "value": "mean_lcoe"},
                {"label": "Transmission", "value": "lcot"},
                {"label": "Total", "value": "total_lcoe"}]
 
+LEAST_COST_CACHE_LIMIT = 5 * 1024 ** 3
 MAP_LAYOUT = dict(
     dragmode="select",
     font_family="Time New Roman",
@@ -370,7 +378,12 @@ TITLES = {
     "mean_cf": "Mean Capacity Factor",
     "mean_lcoe": "Mean Site-Based LCOE",
     "mean_res": "Mean Windspeed",
+    "mean_lcoe_margin": "Site-Based LCOE Margin to Runner-Up",
+    "runner_up_mean_lcoe": "Runner-Up Site-Based LCOE",
+    "runner_up_scenario": "Runner-Up Scenario",
+    "runner_up_total_lcoe": "Runner-Up Total LCOE",
     "total_lcoe": "Total LCOE",
+    "total_lcoe_margin": "Total LCOE Margin to Runner-Up",
     "trans_capacity": "Total Transmission Capacity",
     "trans_cap_cost": "Transmission Capital Costs",
     "transmission_multiplier": "Transmission Cost Multiplier",
@@ -389,7 +402,12 @@ UNITS = {
     "mean_cf": "ratio",
     "mean_lcoe": "$/MWh",
     "mean_res": "m/s",  # This will change based on resource
+    "mean_lcoe_margin": "$/MWh",
+    "runner_up_mean_lcoe": "$/MWh",
+    "runner_up_scenario": "category",
+    "runner_up_total_lcoe": "$/MWh",
     "total_lcoe": "$/MWh",
+    "total_lcoe_margin": "$/MWh",
     "trans_capacity": "MW",
     "trans_cap_cost": "$/MW",
     "transmission_multiplier": "category",
@@ -416,6 +434,48 @@ VARIABLES = [
 ]
 
 
+_COEFFICIENTS = {}
+_COEFFICIENTS_LOCK = threading.Lock()
+_CONFIGS = {}
+_INDEXERS = {}
+_INDEXERS_LOCK = threading.Lock()
+_THRESHOLD_INDEXES = {}
+_THRESHOLD_INDEXES_LOCK = threading.Lock()
+COEFFICIENT_LIMIT = 256 * 1024 ** 2
+INDEXER_LIMIT = 32
+THRESHOLD_FIELDS = ["total_lcoe_threshold", "mean_lcoe_threshold"]
+THRESHOLD_INDEX_LIMIT = 32
+
+
+def load_config(config_path=CONFIG_PATH):
+    """Return the parsed review configuration and its derived views.
+
+    The file is only parsed again when its modification time, inode, or size
+    changes, so Config properties can be accessed as often as needed.
+
+    Parameters
+    ----------
+    config_path : str
+        Path to the review configuration json.
+
+    Returns
+    -------
+    dict
+        A dictionary with the file "signature", the parsed "config", and a
+        "views" dictionary of values derived from this version of the config.
+    """
+    path = os.path.expanduser(config_path)
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+    entry = _CONFIGS.get(path)
+    if entry is None or entry["signature"] != signature:
+        with open(path, "r") as file:
+            config = json.load(file)
+        entry = {"signature": signature, "config": config, "views": {}}
+        _CONFIGS[path] = entry
+    return entry
+
+
 def config_div(config_path):
     """Build the project html div using the review configuration json."""
     with open(config_path, "r") as file:
@@ -454,38 +514,41 @@ def find_scenario(path):
     # Infer scenario
     scenario = os.path.basename(path).replace("_sc.csv", "")
 
-    # Find its scenario
-    for project in Config().projects:
-        config = Config(project).project_config
-        if "parameters" in config:
-            params = config["parameters"]
-            if scenario in params:
-                break
+    # Exact paths first, then the first project with these parameters
+    index = scenario_index()
+    key = os.path.abspath(os.path.expanduser(path))
+    if key in index["paths"]:
+        return index["paths"][key]
+    project = index["scenarios"].get(scenario, index["last"])
     return project, scenario
 
 
 def get_dataframe_path(project, op_values):
     """Get the table for a set of options."""
     # print_args(get_dataframe_path, project, op_values)
-    with open(CONFIG_PATH) as cfile:
-        config = json.load(cfile)
-
     # There will be Nones
     if op_values:
-        # Extract the project config and its data frame
-        project_config = config[project]
-        data = pd.DataFrame(project_config["data"])
-
-        # Find the matching path
+        # Drop options that aren't in the data
+        config = Config(project)
+        values = config._view("option_values", lambda: {
+            col: set(options) for col, options in config.options.items()
+        })
+        keys = {}
         for col, option in op_values.items():
-            if option not in data[col].values:
+            if option not in values[col]:
                 print(option + " not in data.")
             else:
-                data = data[data[col] == option]
+                keys[col] = option
 
+        # Find the matching path
+        columns = tuple(sorted(keys))
+        paths = config._view(("paths", columns), lambda: _option_paths(
+            config.data, columns
+        ))
+        matches = paths.get(tuple(keys[col] for col in columns), [])
         try:
-            assert data.shape[0] == 1
-            path = data["file"].values[0]
+            assert len(matches) == 1
+            path = matches[0]
         except Exception:
             raise AssertionError(
                 Fore.RED
@@ -496,6 +559,16 @@ def get_dataframe_path(project, op_values):
         return path
 
 
+def _option_paths(data, columns):
+    """Map each combination of option values to its files."""
+    paths = {}
+    for key, file in zip(data[list(columns)].itertuples(index=False,
+                                                          name=None),
+                         data["file"]):
+        paths.setdefault(key, []).append(file)
+    return paths
+
+
 def get_scales(file_df, field_units):
     """Create a value scale dictionary for each field-unit pair."""
     def get_range(args):
@@ -568,6 +641,173 @@ def is_number(x):
     return check
 
 
+def lcoe_coefficients(capacity, mean_cf, mean_lcoe, trans_cap_cost,
+                      ovalues):
+    """Precompute the per-row terms of the LCOE and LCOT recalculations.
+
+    Once the capacity factor is fixed, LCOE and LCOT are affine in capex,
+    opex, and fcr, so these terms can be cached and reused for any number of
+    new parameter values with lcoe_recalc.
+
+    Parameters
+    ----------
+    capacity : np.ndarray
+        Capacity values (MW).
+    mean_cf : np.ndarray
+        Capacity factor values from the table (rounded).
+    mean_lcoe : np.ndarray
+        Site-based LCOE values from the table.
+    trans_cap_cost : np.ndarray
+        Transmission capital cost values ($/MW).
+    ovalues : dict
+        The original fcr (ratio), capex, and opex used to build the table.
+
+    Returns
+    -------
+    dict
+        Arrays for "capacity", "capacity_kw", "cf" (backed out from the
+        original LCOE, unrounded), "mean_cf", "lcoe_energy"
+        (capacity * cf * 8760), "lcot_energy" (capacity * mean_cf * 8760),
+        and "trans_cost" (trans_cap_cost * capacity).
+    """
+    capacity = np.asarray(capacity, dtype=np.float64)
+    mean_cf = np.asarray(mean_cf, dtype=np.float64)
+    mean_lcoe = np.asarray(mean_lcoe, dtype=np.float64)
+    trans_cap_cost = np.asarray(trans_cap_cost, dtype=np.float64)
+    capacity_kw = np.multiply(capacity, 1000)
+
+    # Back out the unrounded capacity factor from the original LCOE
+    cf = np.multiply(ovalues["capex"], capacity_kw)
+    np.multiply(ovalues["fcr"], cf, out=cf)
+    np.add(cf, np.multiply(ovalues["opex"], capacity_kw), out=cf)
+    np.divide(cf, np.multiply(mean_lcoe, capacity) * 8760, out=cf)
+
+    coefficients = {
+        "capacity": capacity,
+        "capacity_kw": capacity_kw,
+        "cf": cf,
+        "mean_cf": mean_cf,
+        "lcoe_energy": np.multiply(capacity, cf) * 8760,
+        "lcot_energy": np.multiply(capacity, mean_cf) * 8760,
+        "trans_cost": np.multiply(trans_cap_cost, capacity)
+    }
+
+    return coefficients
+
+
+def lcoe_kernel(capacity, mean_cf, mean_lcoe, trans_cap_cost, ovalues,
+                nvalues, losses=True):
+    """Recalculate capacity factor, LCOE, LCOT, and total LCOE for columns.
+
+    Every step works on whole arrays and writes into preallocated outputs,
+    in the same order of operations as the original row-wise formulas. New
+    parameter values may be column arrays (e.g. shape (n, 1)), in which case
+    each output has one row per parameter combination.
+
+    Parameters
+    ----------
+    capacity : np.ndarray
+        Capacity values (MW).
+    mean_cf : np.ndarray
+        Capacity factor values from the table (rounded).
+    mean_lcoe : np.ndarray
+        Site-based LCOE values from the table.
+    trans_cap_cost : np.ndarray
+        Transmission capital cost values ($/MW).
+    ovalues : dict
+        The original fcr (ratio), capex, opex, and losses (ratio) used to
+        build the table.
+    nvalues : dict
+        New values for the same parameters, as scalars or arrays that
+        broadcast against the table columns.
+    losses : bool
+        Adjust capacity factors if the losses have changed.
+
+    Returns
+    -------
+    dict
+        Arrays for "mean_cf" (the table's capacity factor with new losses),
+        "mean_lcoe", "lcot", and "total_lcoe".
+    """
+    coefficients = lcoe_coefficients(capacity, mean_cf, mean_lcoe,
+                                     trans_cap_cost, ovalues)
+    return lcoe_recalc(coefficients, ovalues, nvalues, losses=losses)
+
+
+def lcoe_recalc(coefficients, ovalues, nvalues, losses=True):
+    """Recalculate LCOE figures from precomputed coefficients.
+
+    Parameters
+    ----------
+    coefficients : dict
+        Per-row terms from lcoe_coefficients.
+    ovalues : dict
+        The original fcr (ratio), capex, opex, and losses (ratio) used to
+        build the table.
+    nvalues : dict
+        New values for the same parameters, as scalars or arrays that
+        broadcast against the table columns.
+    losses : bool
+        Adjust capacity factors if the losses have changed.
+
+    Returns
+    -------
+    dict
+        Arrays for "mean_cf" (the table's capacity factor with new losses),
+        "mean_lcoe", "lcot", and "total_lcoe".
+    """
+    capacity = coefficients["capacity"]
+    capacity_kw = coefficients["capacity_kw"]
+    keys = ["fcr", "capex", "opex", "losses"]
+    shape = np.broadcast_shapes(capacity.shape,
+                                *[np.shape(nvalues[k]) for k in keys])
+
+    # Preallocate outputs and scratch space
+    out = {key: np.empty(shape) for key in ["mean_cf", "mean_lcoe", "lcot",
+                                            "total_lcoe"]}
+    scratch = np.empty(shape)
+
+    # The capacity factors only change with losses
+    out["mean_cf"][...] = coefficients["mean_cf"]
+    lcoe_energy = coefficients["lcoe_energy"]
+    lcot_energy = coefficients["lcot_energy"]
+    if losses:
+        l1 = ovalues["losses"]
+        l2 = np.asarray(nvalues["losses"], dtype=np.float64)
+        changed = l2 != l1
+        if np.any(changed):
+            cf = np.empty(shape)
+            pairs = [(cf, coefficients["cf"]),
+                     (out["mean_cf"], coefficients["mean_cf"])]
+            for adjusted, original in pairs:
+                gross_cf = np.divide(original, 1 - l1)
+                np.multiply(gross_cf, l2, out=adjusted)
+                np.subtract(gross_cf, adjusted, out=adjusted)
+                if not np.all(changed):
+                    np.copyto(adjusted, original, where=~changed)
+            lcoe_energy = np.multiply(capacity, cf)
+            np.multiply(lcoe_energy, 8760, out=lcoe_energy)
+            lcot_energy = np.multiply(capacity, out["mean_cf"])
+            np.multiply(lcot_energy, 8760, out=lcot_energy)
+
+    # LCOE with the unrounded capacity factor
+    lcoe = out["mean_lcoe"]
+    np.multiply(nvalues["capex"], capacity_kw, out=lcoe)
+    np.multiply(nvalues["fcr"], lcoe, out=lcoe)
+    np.multiply(nvalues["opex"], capacity_kw, out=scratch)
+    np.add(lcoe, scratch, out=lcoe)
+    np.divide(lcoe, lcoe_energy, out=lcoe)
+
+    # LCOT with the table's capacity factor
+    lcot = out["lcot"]
+    np.multiply(coefficients["trans_cost"], nvalues["fcr"], out=lcot)
+    np.divide(lcot, lcot_energy, out=lcot)
+
+    np.add(lcoe, lcot, out=out["total_lcoe"])
+
+    return out
+
+
 def map_range(x, range_dict):
     """Assign a key to x given a list of key, value ranges."""
     keys = []
@@ -587,6 +827,38 @@ def reshape_regions():
     return regions
 
 
+def scenario_index(config_path=CONFIG_PATH):
+    """Return reverse lookups of projects for scenario names and paths.
+
+    Built once per version of the config file.
+
+    Returns
+    -------
+    dict
+        "paths" maps absolute file paths to (project, scenario) tuples,
+        "scenarios" maps scenario names to the first project with parameters
+        for that scenario, and "last" is the last project in the config.
+    """
+    entry = load_config(config_path)
+    views = entry["views"]
+    if (None, "scenario_index") not in views:
+        paths = {}
+        scenarios = {}
+        for project, config in entry["config"].items():
+            if "parameters" in config:
+                for scenario in config["parameters"]:
+                    scenarios.setdefault(scenario, project)
+            directory = config.get("directory") or ""
+            for file in config["data"]["file"].values():
+                scenario = os.path.basename(file).replace("_sc.csv", "")
+                path = os.path.abspath(os.path.join(directory, file))
+                paths.setdefault(path, (project, scenario))
+        index = {"paths": paths, "scenarios": scenarios,
+                 "last": list(entry["config"].keys())[-1]}
+        views[(None, "scenario_index")] = index
+    return views[(None, "scenario_index")]
+
+
 def sort_mixed(values):
     """Sort a list of values accounting for possible mixed types."""
     numbers = []
@@ -602,6 +874,47 @@ def sort_mixed(values):
     return sorted_values
 
 
+def threshold_index(df, key=None, fields=None):
+    """Return the threshold index of a table, reusing a cached one.
+
+    Parameters
+    ----------
+    df : pd.core.frame.DataFrame
+        A supply-curve table.
+    key : hashable, optional
+        Something that identifies this version of the table, e.g. its path
+        and file fingerprint. The default of None builds a new index that
+        isn't kept.
+    fields : list, optional
+        Numeric fields that need to be indexed. The default of None uses
+        the THRESHOLD_FIELDS in df.
+
+    Returns
+    -------
+    Threshold_Index
+        The sorted field indexes and gid bitmaps of df.
+    """
+    if key is None:
+        return Threshold_Index(df, fields)
+
+    with _THRESHOLD_INDEXES_LOCK:
+        index = _THRESHOLD_INDEXES.pop(key, None)
+    if index is None or index.size != len(df):
+        index = Threshold_Index(df, fields)
+    elif fields:
+        for field in fields:
+            if field not in index.orders:
+                index.sort(field, df[field].values)
+
+    # Keep the most recently used indexes
+    with _THRESHOLD_INDEXES_LOCK:
+        _THRESHOLD_INDEXES[key] = index
+        while len(_THRESHOLD_INDEXES) > THRESHOLD_INDEX_LIMIT:
+            del _THRESHOLD_INDEXES[next(iter(_THRESHOLD_INDEXES))]
+
+    return index
+
+
 def wmean(df, y, weight="n_gids", on=True):  # <------------------------------------ How to incorporate partial inclusions?
     """Return the weighted average of a column.
 
@@ -711,16 +1024,16 @@ class Config:
     @property
     def config(self):
         """Return the full config dictionary."""
-        with open(self.config_path, "r") as file:
-            config = json.load(file)
-        return config
+        return load_config(self.config_path)["config"]
 
     @property
     def data(self):
         """Return a pandas data frame with fuill file paths."""
         if self.project:
-            data = pd.DataFrame(self.project_config["data"])
-            return data
+            data = self._view("data", lambda: pd.DataFrame(
+                self.project_config["data"]
+            ))
+            return data.copy()
 
     @property
     def directory(self):
@@ -731,22 +1044,27 @@ class Config:
     @property
     def files(self):
         """Return a dictionary of scenario with full paths to files."""
-        files = {}
-        for file in self.data["file"]:
-            scenario = file.replace("_sc.csv", "")
-            files[scenario] = os.path.join(self.directory, file)
-        return files
+        def build():
+            files = {}
+            for file in self.data["file"]:
+                scenario = file.replace("_sc.csv", "")
+                files[scenario] = os.path.join(self.directory, file)
+            return files
+        return dict(self._view("files", build))
 
     @property
     def options(self):
         """Not all options will be available for every grouping variable."""
-        if self.project:
+        def build():
             options = {}
-            data = pd.DataFrame(self.project_config["data"])
+            data = self.data
             del data["file"]
             for col in data.columns:
                 options[col] = list(data[col].unique())
             return options
+        if self.project:
+            options = self._view("options", build)
+            return {key: list(values) for key, values in options.items()}
 
     @property
     def projects(self):
@@ -772,10 +1090,12 @@ class Config:
     @property
     def scenarios(self):
         """Return just a list of scenario names."""
-        scenarios = []
-        for file in self.data["file"]:
-            scenarios.append(file.replace("_sc.csv", ""))
-        return scenarios
+        def build():
+            scenarios = []
+            for file in self.data["file"]:
+                scenarios.append(file.replace("_sc.csv", ""))
+            return scenarios
+        return list(self._view("scenarios", build))
 
     @property
     def titles(self):
@@ -787,13 +1107,27 @@ class Config:
     @property
     def units(self):
         """Return a units dictionary with extra fields."""
-        if self.project:
+        def build():
             units = self.project_config["units"]
 
             # In case we update the standard set
             addons = {k: u for k, u in UNITS.items() if k not in units}
             units = {**units, **addons}
             return units
+        if self.project:
+            return dict(self._view("units", build))
+
+    def _view(self, name, build):
+        """Return a value derived from the project config.
+
+        Views are built once per version of the config file and shared by
+        every Config object in the process, so callers get copies.
+        """
+        views = load_config(self.config_path)["views"]
+        key = (self.project, name)
+        if key not in views:
+            views[key] = build()
+        return views[key]
 
 
 class Categories(Config):
@@ -929,58 +1263,6 @@ class Data(Config):
 
         return df
 
-    def lcoe(self, capacity, mean_cf, recalcs, ovalues):
-        """Recalculate LCOE.
-
-        Parameters
-        ----------
-        capacity : pd.core.series.Series | np.ndarray
-            A series of capacity values.
-        mean_cf : pd.core.series.Series | np.ndarray
-            A series of capacity factor values.
-        recalcs : dict
-            A dictionary with new entries for capex, opex, and fcr.
-        ovalues : dict
-            A dicitonary with the original values for capex, opex, and fcr.
-
-        Returns
-        -------
-        np.ndarray
-            A series of LCOE values.
-        """
-        capacity_kw = capacity * 1000
-        cc = recalcs["capex"] * capacity_kw
-        om = recalcs["opex"] * capacity_kw
-        fcr = recalcs["fcr"]
-        lcoe = ((fcr * cc) + om) / (capacity * mean_cf * 8760)
-        return lcoe
-
-    def lcot(self, capacity, trans_cap_cost, mean_cf, recalcs, ovalues):
-        """Recalculate LCOT.
-
-        Parameters
-        ----------
-        capacity : pd.core.series.Series | np.ndarray
-            A series of capacity values.
-        trans_cap_cost : pd.core.series.Series | np.ndarray
-            A series of transmission capital cost values.
-        mean_cf : pd.core.series.Series | np.ndarray
-            A series of capacity factor values.
-        recalcs : dict
-            A dictionary with new entries for capex, opex, and fcr.
-        ovalues : dict
-            A dicitonary with the original values for capex, opex, and fcr.
-
-        Returns
-        -------
-        np.ndarray
-            A series of LCOT values.
-        """
-        fcr = recalcs["fcr"]
-        cc = trans_cap_cost * capacity
-        lcot = (cc * fcr) / (capacity * mean_cf * 8760)
-        return lcot
-
     def original_parameters(self, scenario):
         """Return the original parameters for fcr, capex, opex, and losses."""
         fields = self._find_fields(scenario)
@@ -1018,8 +1300,7 @@ class Data(Config):
         columns = ids + fields
 
         # We might need to add fields before we can these in
-        df_columns = pd.read_csv(path, index_col=0, nrows=0).columns
-        df_columns = df_columns.tolist()
+        df_columns = self._cols(path)
         # if not all([c in df_columns for c in columns]):
         #     self._set_fields(path)
 
@@ -1031,9 +1312,9 @@ class Data(Config):
         if "scenario" in df_columns:
             columns += ["scenario"]
 
-        # Read in table
-        columns = [c for c in columns if c in self._cols(path)]
-        df = pd.read_csv(path, usecols=columns, low_memory=False)
+        # Read in table (in file order, as read_csv's usecols would)
+        columns = [c for c in df_columns if c in columns]
+        df = columnar.read_table(path, columns=columns)
 
         return df
 
@@ -1053,43 +1334,128 @@ class Data(Config):
         pd.core.frame.DataFrame
             A supply-curve module data frame with recalculated values.
         """
-        # Read in data
+        # Get the cached table and its coefficients
         df = self.read(scenario)
+        entry = self._coefficients(scenario, df)
+        _, recalcs = self._parameters(scenario, recalcs)
 
-        # If any of these aren't specified, use the original values
-        ovalues = self.original_parameters(scenario)
-        for key, value in recalcs.items():
-            if not value:
-                recalcs[key] = ovalues[key]
-            else:
-                recalcs[key] = self._fix_format(recalcs[key])
+        # Recalculate figures
+        values = lcoe_recalc(entry["coefficients"], entry["ovalues"],
+                             recalcs)
+        df["mean_cf"] = values["mean_cf"]  # What else will this affect?
+        df["mean_lcoe"] = values["mean_lcoe"]
+        df["lcot"] = values["lcot"]
+        df["total_lcoe"] = values["total_lcoe"]
 
-        # Get the right units for percentages
-        ovalues["fcr"] = self._check_percentage(ovalues["fcr"])
-        recalcs["fcr"] = self._check_percentage(recalcs["fcr"])
-        ovalues["losses"] = self._check_percentage(ovalues["losses"])
-        recalcs["losses"] = self._check_percentage(recalcs["losses"])
+        return df
 
-        # Extract needed variables as vectors
-        capacity = df["capacity"].values
-        mean_cf = df["mean_cf"].values
-        mean_lcoe = df["mean_lcoe"].values
-        trans_cap_cost = df["trans_cap_cost"].values
+    def sweep(self, scenario, grid, weight="n_gids", threshold=None,
+              arrays=False, chunk_size=64):
+        """Recalculate a table for many parameter combinations at once.
 
-        # Adjust capacity factor for LCOE
-        mean_cf_adj = self._get_cf(mean_cf, capacity, mean_lcoe, recalcs,
-                                   ovalues, adjust=True)
-        mean_cf = self._get_cf(mean_cf, capacity, mean_lcoe, recalcs, ovalues,
-                               adjust=False)
+        The needed columns are read once and each chunk of combinations is
+        evaluated as a single (combinations x rows) array computation.
 
-        # Recalculate figures
-        df["mean_cf"] = mean_cf  # What else will this affect?
-        df["mean_lcoe"] = self.lcoe(capacity, mean_cf_adj, recalcs, ovalues)
-        df["lcot"] = self.lcot(capacity, trans_cap_cost, mean_cf, recalcs,
-                               ovalues)
-        df["total_lcoe"] = df["mean_lcoe"] + df["lcot"]
+        Parameters
+        ----------
+        scenario : str
+            The scenario key or data path for the desired data table.
+        grid : list | pd.core.frame.DataFrame
+            Parameter combinations, as a list of dictionaries or a data frame
+            with any of the fcr, capex, opex, and losses keys. Missing or
+            empty values (None, NaN, or "") use the scenario's original
+            parameters, other values, including zeros, are used as given.
+        weight : str
+            Column name of the variable to use as weights for mean values.
+            The default is 'n_gids'.
+        threshold : numeric, optional
+            A total LCOE threshold. If given, the capacity of all sites at or
+            below it is returned for each combination.
+        arrays : bool
+            Also return the full recalculated arrays.
+        chunk_size : int
+            Number of combinations to evaluate at once.
 
-        return df
+        Returns
+        -------
+        pd.core.frame.DataFrame | tuple
+            A data frame with one row per combination containing the
+            parameters used, weighted mean LCOE, LCOT, and total LCOE, and
+            the capacity under the threshold. If arrays is True, a float32
+            array of shape (combinations, 4, rows) is returned as well, with
+            mean_cf, mean_lcoe, lcot, and total_lcoe along the second axis.
+        """
+        # Find the path and the scenario key
+        path = scenario
+        if not os.path.isfile(path):
+            path = self.files[scenario]
+        else:
+            scenario = os.path.basename(path).replace("_agg.csv", "")
+            scenario = scenario.replace("_sc.csv", "")
+
+        # Read only the needed columns
+        needed = ["capacity", "mean_cf", "mean_lcoe", "trans_cap_cost"]
+        columns = list(dict.fromkeys(needed + [weight]))
+        df = columnar.read_table(path, columns=columns)
+
+        # Complete each combination with the original values. Only missing
+        # values are replaced, zeros are kept
+        keys = ["fcr", "capex", "opex", "losses"]
+        grid = pd.DataFrame(grid).reindex(columns=keys)
+        ovalues, _ = self._parameters(scenario, {})
+        def number(value):
+            if value is None or value == "":
+                return np.nan
+            return self._fix_format(value)
+
+        params = pd.DataFrame(index=grid.index)
+        for key in keys:
+            values = grid[key].map(number).astype(np.float64)
+            values = values.fillna(ovalues[key]).values
+            if key in ["fcr", "losses"]:
+                values = np.where(values > 1, values / 100, values)
+            params[key] = values
+        params = params.reset_index(drop=True)
+
+        # Weights with NaNs are ignored, as in wmean
+        weights = df[weight].values.astype(np.float64)
+        weights = np.where(np.isnan(weights), 0, weights)
+        capacity = df["capacity"].values
+
+        block = None
+        if arrays:
+            block = np.empty((len(params), 4, len(df)), dtype=np.float32)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            coefficients = lcoe_coefficients(capacity, df["mean_cf"].values,
+                                             df["mean_lcoe"].values,
+                                             df["trans_cap_cost"].values,
+                                             ovalues)
+
+        summaries = []
+        for start in range(0, len(params), chunk_size):
+            chunk = params.iloc[start: start + chunk_size]
+            nvalues = {k: chunk[k].values[:, np.newaxis] for k in keys}
+            with np.errstate(divide="ignore", invalid="ignore"):
+                values = lcoe_recalc(coefficients, ovalues, nvalues)
+
+            summary = chunk.copy()
+            for field in ["mean_lcoe", "lcot", "total_lcoe"]:
+                summary[field] = self._wmeans(values[field], weights)
+            if threshold is not None:
+                under = values["total_lcoe"] <= threshold
+                summary["capacity"] = np.where(under, capacity, 0).sum(axis=1)
+            summaries.append(summary)
+
+            if arrays:
+                for i, field in enumerate(["mean_cf", "mean_lcoe", "lcot",
+                                           "total_lcoe"]):
+                    block[start: start + len(chunk), i] = values[field]
+
+        summary = pd.concat(summaries).reset_index(drop=True)
+        if arrays:
+            return summary, block
+        return summary
 
     def _check_percentage(self, value):
         """Check if a value is a decimal or percentage (Assuming here)."""
@@ -1115,24 +1481,38 @@ class Data(Config):
             value = float(value)
         return value
 
-    def _get_cf(self, mean_cf, capacity, mean_lcoe, recalcs, ovalues, adjust):
-        """Return a properly rounded capacity factor from a table row."""
-        # Back out cf from lcoe to fix rounding error, if needed
-        if adjust:
-            capacity_kw = capacity * 1000
-            cc = ovalues["capex"] * capacity_kw
-            om = ovalues["opex"] * capacity_kw
-            fcr = ovalues["fcr"]
-            mean_cf = ((fcr * cc) + om) / (mean_lcoe * capacity * 8760)
-
-        # Recalculate losses, if needed
-        if recalcs["losses"] != ovalues["losses"]:
-            l1 = ovalues["losses"]
-            l2 = recalcs["losses"]
-            gross_cf = mean_cf / (1 - l1)
-            mean_cf = gross_cf - (gross_cf * l2)
-
-        return mean_cf
+    def _parameters(self, scenario, recalcs):
+        """Return the original and new parameters as ratios and floats.
+
+        Parameters
+        ----------
+        scenario : str
+            The scenario key for the desired data table.
+        recalcs : dict
+            New values for fcr, capex, opex, and losses. Empty values are
+            replaced with the scenario's original values.
+
+        Returns
+        -------
+        tuple
+            The original and new parameter dictionaries.
+        """
+        # If any of these aren't specified, use the original values
+        ovalues = self.original_parameters(scenario)
+        recalcs = {key: recalcs.get(key) for key in ovalues}
+        for key, value in recalcs.items():
+            if not value:
+                recalcs[key] = ovalues[key]
+            else:
+                recalcs[key] = self._fix_format(recalcs[key])
+
+        # Get the right units for percentages
+        ovalues["fcr"] = self._check_percentage(ovalues["fcr"])
+        recalcs["fcr"] = self._check_percentage(recalcs["fcr"])
+        ovalues["losses"] = self._check_percentage(ovalues["losses"])
+        recalcs["losses"] = self._check_percentage(recalcs["losses"])
+
+        return ovalues, recalcs
 
     def _set_field(self, path, field):
         """Assign a particular resource class to an sc df."""
@@ -1184,9 +1564,77 @@ class Data(Config):
         for field in RESOURCE_CLASSES.keys():
             self._set_field(path, field)
 
+    def _coefficients(self, scenario, df=None):
+        """Return a scenario's cached LCOE coefficients.
+
+        Only the coefficient arrays are kept, per process, up to
+        COEFFICIENT_LIMIT bytes for all scenarios. Entries are rebuilt when
+        the table or the scenario's original parameters change.
+
+        Parameters
+        ----------
+        scenario : str
+            The scenario key for the desired data table.
+        df : pd.core.frame.DataFrame, optional
+            The scenario's table, if it's already been read.
+
+        Returns
+        -------
+        dict
+            A dictionary with the original parameters ("ovalues") and the
+            "coefficients" from lcoe_coefficients.
+        """
+        path = self.files[scenario]
+        ovalues, _ = self._parameters(scenario, {})
+        signature = (columnar.fingerprint_key(path),
+                     tuple(sorted(ovalues.items())))
+        with _COEFFICIENTS_LOCK:
+            entry = _COEFFICIENTS.pop(path, None)
+            if entry is not None and entry["signature"] == signature:
+                _COEFFICIENTS[path] = entry
+                return entry
+
+        if df is None:
+            df = self.read(scenario)
+        coefficients = lcoe_coefficients(df["capacity"].values,
+                                         df["mean_cf"].values,
+                                         df["mean_lcoe"].values,
+                                         df["trans_cap_cost"].values,
+                                         ovalues)
+        size = sum(array.nbytes for array in coefficients.values())
+        entry = {"signature": signature, "ovalues": ovalues,
+                 "coefficients": coefficients, "size": size}
+
+        # Keep the most recently used entries that fit
+        with _COEFFICIENTS_LOCK:
+            _COEFFICIENTS[path] = entry
+            total = sum(e["size"] for e in _COEFFICIENTS.values())
+            while total > COEFFICIENT_LIMIT and len(_COEFFICIENTS) > 1:
+                total -= _COEFFICIENTS.pop(next(iter(_COEFFICIENTS)))["size"]
+
+        return entry
+
     def _cols(self, file):
-        """Return only the columns of a csv file."""
-        return pd.read_csv(file, index_col=0, nrows=0).columns
+        """Return only the columns of a csv file (minus the index column)."""
+        return columnar.columns(file)[1:]
+
+    def _wmeans(self, values, weights):
+        """Return the weighted mean of each row of values, ignoring NaNs."""
+        valid = ~np.isnan(values)
+        rweights = np.where(valid, weights, 0)
+        totals = rweights.sum(axis=1)
+        sums = np.where(valid, values * rweights, 0).sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            means = sums / totals
+
+        # Weights might all be 0s
+        unweighted = totals == 0
+        if unweighted.any():
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                means[unweighted] = np.nanmean(values[unweighted], axis=1)
+
+        return means
 
 
 class Defaults(Config):
@@ -1352,19 +1800,491 @@ class Difference:
                 diff = 100 * (diff / x.iloc[1])
             return diff
 
-    def calc(self, df1, df2, field):
-        """Calculate difference between each row in two data frames."""
+    def calc(self, df1, df2, field, key=None):
+        """Calculate difference between each row in two data frames.
+
+        Rows are matched on sc_point_gid through an index, and the
+        differences are computed for whole columns at once. Points in df1
+        that aren't in df2 get NaN.
+
+        Parameters
+        ----------
+        df1 : pd.core.frame.DataFrame
+            The supply-curve table to difference from.
+        df2 : pd.core.frame.DataFrame
+            The supply-curve table to difference against.
+        field : str | list
+            One or more fields to difference.
+        key : hashable, optional
+            Identifies the versions of the two tables (e.g. their source
+            fingerprints), so their index can be cached and reused. The
+            default of None builds a new index.
+
+        Returns
+        -------
+        pd.core.frame.DataFrame
+            The rows of df1 with a sc_point_gid, indexed by sc_point_gid,
+            with the field columns replaced by their absolute differences
+            (df1 - df2) or, if units is "%", their percent differences, and
+            moved to the end.
+        """
         print("Calculating difference...")
-        group = "sc_point_gid"
-        df = pd.concat([df1, df2])
-        pcts = df.groupby(group)[field].apply(self.diff)
-        ndf = df1.copy()
-        ndf.index = df1["sc_point_gid"]
-        del ndf[field]
-        ndf = ndf.merge(pcts.to_frame(), left_index=True, right_index=True)
+        fields = [field] if isinstance(field, str) else list(field)
+        gids = df1["sc_point_gid"]
+        keep = gids.notnull().values
+        idx = self.indexer(gids.values[keep], df2["sc_point_gid"].values,
+                           key=key)
+        found = idx > -1
+
+        ndf = df1[keep].drop(columns=fields)
+        ndf.index = gids[keep]
+        for field in fields:
+            values = np.full(idx.size, np.nan)
+            values1 = df1[field].values[keep][found].astype(np.float64)
+            values2 = df2[field].values[idx[found]].astype(np.float64)
+            diff = values1 - values2
+            if self.units == "%":
+                diff = 100 * (diff / values2)
+            values[found] = diff
+            ndf[field] = values
+
         print("Difference calculated.")
         return ndf
 
+    def indexer(self, gids1, gids2, key=None):
+        """Return the positions of one set of gids in another.
+
+        Parameters
+        ----------
+        gids1 : np.ndarray
+            The sc_point_gids to find.
+        gids2 : np.ndarray
+            The sc_point_gids to search.
+        key : hashable, optional
+            Identifies the versions of the tables the gids came from. Only
+            keyed indexes are cached.
+
+        Returns
+        -------
+        np.ndarray
+            The position of the first occurrence of each of gids1 in gids2,
+            or -1 if it isn't there.
+        """
+        if key is not None:
+            with _INDEXERS_LOCK:
+                idx = _INDEXERS.pop(key, None)
+                if idx is not None:
+                    _INDEXERS[key] = idx
+                    return idx
+
+        unique, first = np.unique(gids2, return_index=True)
+        if unique.size:
+            positions = np.searchsorted(unique, gids1)
+            positions[positions == unique.size] = 0
+            idx = np.where(unique[positions] == gids1, first[positions], -1)
+        else:
+            idx = np.full(len(gids1), -1)
+
+        # Keep the most recently used indexers
+        if key is not None:
+            with _INDEXERS_LOCK:
+                _INDEXERS[key] = idx
+                while len(_INDEXERS) > INDEXER_LIMIT:
+                    del _INDEXERS[next(iter(_INDEXERS))]
+
+        return idx
+
+
+class Difference_Matrix(Config):
+    """Class to compare many scenarios to each other at once.
+
+    The values of a variable for every scenario are aligned once into a
+    (scenario x sc_point_gid) array, or taken from the project's scenario
+    cube if it's current, from which summaries for all pairs are computed
+    with matrix products and single pair differences are computed and kept
+    as needed.
+    """
+
+    def __init__(self, project, variable="total_lcoe", scenarios=None,
+                 weight="n_gids"):
+        """Initialize Difference_Matrix object.
+
+        Parameters
+        ----------
+        project : str
+            The reView project name.
+        variable : str
+            The variable to difference.
+        scenarios : list, optional
+            Scenario names or table paths to compare. Defaults to all of the
+            project's scenarios.
+        weight : str
+            Column name of the variable to use as weights for mean
+            differences. The default is 'n_gids'.
+        """
+        super().__init__(project)
+        if scenarios is None:
+            scenarios = self.scenarios
+        self.variable = variable
+        self.weight = weight
+        self.paths = [s if os.path.isfile(s) else self.files[s]
+                      for s in scenarios]
+        self.names = [os.path.basename(p).replace("_sc.csv", "")
+                      for p in self.paths]
+        self._cube = None
+        self._pairs = {}
+
+    def __repr__(self):
+        """Print representation string."""
+        msg = (f"<reView Difference_Matrix object: project='{self.project}', "
+               f"variable='{self.variable}', {len(self.names)} scenarios>")
+        return msg
+
+    @property
+    def cube(self):
+        """Return the aligned values, weights, and capacities.
+
+        Returns
+        -------
+        dict
+            The sorted union of all "gids", and (scenario x gid) arrays of
+            "values", "weights", and "capacity", with NaNs where a scenario
+            doesn't have a point.
+        """
+        if self._cube is None:
+            self._cube = self._stored_cube()
+        if self._cube is None:
+            columns = list(dict.fromkeys(["sc_point_gid", self.variable,
+                                          self.weight, "capacity"]))
+            dfs = [columnar.read_table(path, columns=columns)
+                   for path in self.paths]
+            dfs = [df[df["sc_point_gid"].notnull()] for df in dfs]
+            gids = np.unique(np.concatenate([df["sc_point_gid"].values
+                                             for df in dfs]))
+
+            shape = (len(dfs), gids.size)
+            cube = {"gids": gids}
+            for key, column in [("values", self.variable),
+                                ("weights", self.weight),
+                                ("capacity", "capacity")]:
+                cube[key] = np.full(shape, np.nan)
+                for i, df in enumerate(dfs):
+                    idx = np.searchsorted(gids, df["sc_point_gid"].values)
+                    cube[key][i, idx] = df[column].values
+            self._cube = cube
+        return self._cube
+
+    def pair(self, scenario_a, scenario_b, units=None):
+        """Return the difference between two scenarios at each point.
+
+        Parameters
+        ----------
+        scenario_a : str
+            The scenario name to difference from.
+        scenario_b : str
+            The scenario name to difference against.
+        units : str, optional
+            Use "%" for percent differences (relative to scenario_b),
+            otherwise differences are in the variable's units.
+
+        Returns
+        -------
+        pd.core.series.Series
+            Differences indexed by sc_point_gid, NaN where either scenario
+            doesn't have a value.
+        """
+        key = (scenario_a, scenario_b, units == "%")
+        if key not in self._pairs:
+            cube = self.cube
+            values_a = cube["values"][self.names.index(scenario_a)]
+            values_b = cube["values"][self.names.index(scenario_b)]
+            diff = values_a - values_b
+            if units == "%":
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    diff = 100 * (diff / values_b)
+            self._pairs[key] = pd.Series(diff, index=cube["gids"],
+                                         name=self.variable)
+            self._pairs[key].index.name = "sc_point_gid"
+        return self._pairs[key].copy()
+
+    def _stored_cube(self):
+        """Return the needed arrays from a current project cube, if any."""
+        from review.cube import Scenario_Cube
+
+        cube = Scenario_Cube(self.project)
+        variables = [self.variable, self.weight, "capacity"]
+        if cube.stale != [] or not set(variables) <= set(cube.variables):
+            return None
+        files = self.files
+        if any(files.get(n) != p for p, n in zip(self.paths, self.names)):
+            return None
+
+        rows = [cube.scenarios.index(name) for name in self.names]
+        stored = {"gids": np.asarray(cube.gids)}
+        for key, variable in zip(["values", "weights", "capacity"],
+                                 variables):
+            stored[key] = cube.array(variable)[rows]
+        return stored
+
+    def summary(self, baseline=None):
+        """Return mean differences for every pair of scenarios.
+
+        Each mean is taken over the points both scenarios have and weighted
+        by scenario A's weights or capacities.
+
+        Parameters
+        ----------
+        baseline : str, optional
+            Only return comparisons of each scenario to this scenario.
+
+        Returns
+        -------
+        pd.core.frame.DataFrame
+            A table with scenario_a, scenario_b, the number of shared points,
+            the weighted mean difference (A - B), and the capacity-weighted
+            mean difference for each pair.
+        """
+        cube = self.cube
+        shared = (~np.isnan(cube["values"])).astype(np.float64)
+        values = np.where(shared > 0, cube["values"], 0)
+
+        # Sum of weighted differences over shared points = weighted A values
+        # at points in B minus A's weights times B values at points in A
+        summaries = {"n_points": shared @ shared.T}
+        for key, weights in [("mean_difference", cube["weights"]),
+                             ("capacity_difference", cube["capacity"])]:
+            weights = np.where(np.isnan(weights), 0, weights) * shared
+            totals = weights @ shared.T
+            sums = (weights * values) @ shared.T - weights @ values.T
+            with np.errstate(divide="ignore", invalid="ignore"):
+                summaries[key] = np.where(totals != 0, sums / totals, np.nan)
+
+        df = pd.DataFrame({
+            "scenario_a": np.repeat(self.names, len(self.names)),
+            "scenario_b": np.tile(self.names, len(self.names)),
+            "n_points": summaries["n_points"].ravel().astype(int),
+            "mean_difference": summaries["mean_difference"].ravel(),
+            "capacity_difference": summaries["capacity_difference"].ravel()
+        })
+        df = df[df["scenario_a"] != df["scenario_b"]]
+        if baseline is not None:
+            df = df[df["scenario_b"] == baseline]
+
+        return df.reset_index(drop=True)
+
+
+class Filter_Pipeline:
+    """Class to filter one table with many independently cached masks.
+
+    Each filter (states, thresholds, masks, selections) is compiled into a
+    boolean mask over the rows of a base table and kept, so changing one
+    filter only recomputes that filter's mask. The masks are combined with
+    AND and only the requested columns of the remaining rows are copied out.
+    """
+
+    def __init__(self, df, limit=64):
+        """Initialize Filter_Pipeline object.
+
+        Parameters
+        ----------
+        df : pd.core.frame.DataFrame
+            The base table with an sc_point_gid column.
+        limit : int
+            The number of masks to keep.
+        """
+        self.df = df
+        self.limit = limit
+        self.masks = {}
+        self._index = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        """Return representation string for Filter_Pipeline object."""
+        return (f"<Filter_Pipeline: {len(self.df)} rows, "
+                f"{len(self.masks)} masks>")
+
+    @property
+    def index(self):
+        """Return the sorted field index of the base table."""
+        if self._index is None:
+            self._index = Threshold_Index(self.df, fields=[])
+        return self._index
+
+    def apply(self, keep=None, columns=None):
+        """Return the rows and columns of the base table that pass.
+
+        Parameters
+        ----------
+        keep : np.ndarray, optional
+            A boolean row mask, e.g. from combine. The default of None
+            keeps every row.
+        columns : list, optional
+            The columns to return. The default of None returns them all.
+
+        Returns
+        -------
+        pd.core.frame.DataFrame
+            A new table with the kept rows and requested columns.
+        """
+        df = self.df
+        if columns is not None:
+            df = df[list(columns)]
+        elif keep is None:
+            return df.copy()
+        if keep is not None:
+            df = df[keep]
+        return df
+
+    def combine(self, *masks):
+        """Combine row masks, skipping any that are None, with AND."""
+        keep = np.ones(len(self.df), dtype=bool)
+        for mask in masks:
+            if mask is not None:
+                keep &= mask
+        return keep
+
+    def gids(self, gids):
+        """Return a row mask of the points with one of a list of gids.
+
+        Parameters
+        ----------
+        gids : list
+            The sc_point_gids to keep, e.g. from a chart selection.
+
+        Returns
+        -------
+        np.ndarray
+            A boolean array that is True for each row with one of the gids.
+        """
+        gids = np.asarray(gids, dtype=np.float64)
+        key = ("gids", hashlib.md5(gids.tobytes()).hexdigest())
+        mask = self._get(key)
+        if mask is None:
+            gids = gids[~np.isnan(gids)].astype(np.int64)
+            gids = gids[gids > -1]
+            bitmap = np.zeros(gids.max() + 1 if gids.size else 0, dtype=bool)
+            bitmap[gids] = True
+            mask = self._keep(key, self.index.contains(bitmap))
+        return mask
+
+    def mask(self, other, field, threshold):
+        """Return a row mask of the points not under a threshold in another
+        table.
+
+        Parameters
+        ----------
+        other : Threshold_Index
+            The index of the table to mask with.
+        field : str
+            The field to threshold in the other table.
+        threshold : int | float
+            The threshold value. Points in the other table at or under this
+            are removed.
+
+        Returns
+        -------
+        np.ndarray
+            A boolean array that is True for each row to keep.
+        """
+        key = ("mask", other, field, threshold)
+        mask = self._get(key)
+        if mask is None:
+            if field not in other.orders:
+                raise KeyError(f"{field} is not indexed in {other}.")
+            under = other.below(field, threshold, inclusive=True)
+            mask = self._keep(key, ~self.index.contains(other.bitmap(under)))
+        return mask
+
+    def select(self, keep, positions):
+        """Return a row mask of positions within the rows already kept.
+
+        Parameters
+        ----------
+        keep : np.ndarray
+            A boolean row mask of the rows the positions refer to.
+        positions : list
+            Positions in the table of kept rows, e.g. from a map selection.
+
+        Returns
+        -------
+        np.ndarray
+            A boolean array that is True for each selected row.
+        """
+        rows = np.flatnonzero(keep)[positions]
+        mask = np.zeros(len(self.df), dtype=bool)
+        mask[rows] = True
+        return mask
+
+    def states(self, states):
+        """Return a row mask of the points in a list of states.
+
+        Parameters
+        ----------
+        states : list
+            State names and/or "offshore" or "onshore". States are only
+            filtered if at least one of them is in the table.
+
+        Returns
+        -------
+        np.ndarray
+            A boolean array that is True for each row to keep.
+        """
+        key = ("states", tuple(states))
+        mask = self._get(key)
+        if mask is None:
+            keep = np.ones(len(self.df), dtype=bool)
+            values = self.df["state"]
+            found = values.isin(states).values
+            if found.any():
+                keep &= found
+            if "offshore" in self.df.columns:
+                if "offshore" in states:
+                    keep &= (self.df["offshore"] == 1).values
+                if "onshore" in states:
+                    keep &= (self.df["offshore"] == 0).values
+            mask = self._keep(key, keep)
+        return mask
+
+    def threshold(self, field, threshold):
+        """Return a row mask of the points under a threshold.
+
+        Parameters
+        ----------
+        field : str
+            The field to threshold.
+        threshold : int | float
+            The threshold value.
+
+        Returns
+        -------
+        np.ndarray
+            A boolean array that is True for each row under the threshold.
+        """
+        key = ("threshold", field, threshold)
+        mask = self._get(key)
+        if mask is None:
+            if field not in self.index.orders:
+                self.index.sort(field, self.df[field].values)
+            mask = self._keep(key, self.index.below(field, threshold))
+        return mask
+
+    def _get(self, key):
+        """Return a kept mask (or None) and mark it as recently used."""
+        with self._lock:
+            mask = self.masks.pop(key, None)
+            if mask is not None:
+                self.masks[key] = mask
+        return mask
+
+    def _keep(self, key, mask):
+        """Keep a mask, dropping the least recently used ones."""
+        mask.flags.writeable = False
+        with self._lock:
+            self.masks[key] = mask
+            while len(self.masks) > self.limit:
+                del self.masks[next(iter(self.masks))]
+        return mask
+
 
 class LCOE(Config):  # <------------------------------------------------------- This will only work for the Transition/ATB projects, the parameter names are standardized yet
     """Class to recalculate LCOE with different parameters."""
@@ -1376,38 +2296,34 @@ class LCOE(Config):  # <-------------------------------------------------------
         msg = f"<LCOE object: path={self.config_path}, project={self.project}>"
         return msg
 
-    def lcoe(self, row, nvalues, ovalues):
-        """Calculate LCOE for a single row.
+    def recalc(self, scenario, fcr=None, capex=None, opex=None, losses=None,
+               columns=None):
+        """Recalculate LCOE for a data frame given a specific FCR.
+
+        Losses are accepted for consistency with Data.build but, as before,
+        do not change the results here.
 
         Parameters
         ----------
-        row: pd.core.series.Series
-            A row in a pandas data frame.
-        nvalues: dict
-            A dictionary with new entries for capex, opex, and fcr.
-        ovalues: dict
-            A dicitonary with the original entries for capex, opex, and fcr.
+        scenario : str
+            The scenario key for the desired data table.
+        fcr : str | numeric
+            Fixed charge rate as a percentage.
+        capex : str | numeric
+            Capital expenditure in USD / KW
+        opex : str | numeric
+            Fixed operating costs in USD / KW
+        losses : str | numeric
+            Generation losses as a percentage.
+        columns : list, optional
+            Additional columns to return. The default of None returns the
+            full table.
+
+        Returns
+        -------
+        pd.core.frame.DataFrame
+            A supply-curve table with recalculated LCOE figures.
         """
-        capacity = row["capacity"] * 1000
-        cc = nvalues["capex"] * capacity
-        om = nvalues["opex"] * capacity
-        fcr = nvalues["fcr"]
-        cf = self._get_cf(row, ovalues)
-        lcoe = ((fcr * cc) + om) / (row["capacity"] * cf * 8760)
-        return lcoe
-
-    def lcot(self, row, nvalues, ovalues):
-        """Calculate LCOT for a single row."""
-        capacity = row["capacity"]
-        fcr = nvalues["fcr"]
-        cc = row["trans_cap_cost"] * capacity
-#        cf = self._get_cf(row, ovalues)  # <---------------------------------- LCOT uses the table's cf (not as accurate), lcoe uses the original unrounded cf (more accurate)
-        cf = row["mean_cf"]
-        lcot = (cc * fcr) / (capacity * cf * 8760)
-        return lcot
-
-    def recalc(self, scenario, fcr=None, capex=None, opex=None, losses=None):
-        """Recalculate LCOE for a data frame given a specific FCR."""
         # Get our constants
         fields = self._find_fields(scenario)
         config = self.project_config
@@ -1432,14 +2348,19 @@ class LCOE(Config):  # <-------------------------------------------------------
         fname = files["file"][files["file"].str.contains(scenario)].values[0]
         directory = config["directory"]
         path = os.path.join(directory, fname)
-        df = pd.read_csv(path, low_memory=False)
+        if columns is not None:
+            needed = ["capacity", "mean_cf", "mean_lcoe", "trans_cap_cost"]
+            columns = list(dict.fromkeys(needed + list(columns)))
+        df = columnar.read_table(path, columns=columns)
 
         # Recalculate LCOE figures
-        df["mean_lcoe"] = df.apply(self.lcoe, nvalues=nvalues, ovalues=ovalues,
-                                   axis=1)
-        df["lcot"] = df.apply(self.lcot, nvalues=nvalues, ovalues=ovalues,
-                              axis=1)
-        df["total_lcoe"] = df["mean_lcoe"] + df["lcot"]
+        values = lcoe_kernel(df["capacity"].values, df["mean_cf"].values,
+                             df["mean_lcoe"].values,
+                             df["trans_cap_cost"].values, ovalues, nvalues,
+                             losses=False)
+        df["mean_lcoe"] = values["mean_lcoe"]
+        df["lcot"] = values["lcot"]
+        df["total_lcoe"] = values["total_lcoe"]
 
         return df
 
@@ -1461,15 +2382,6 @@ class LCOE(Config):  # <-------------------------------------------------------
             value = float(value)
         return value
 
-    def _get_cf(self, row, ovalues):
-        """Return a properly rounded capacity factor from a table row."""
-        capacity = row["capacity"] * 1000
-        cc = ovalues["capex"] * capacity
-        om = ovalues["opex"] * capacity
-        fcr = ovalues["fcr"]
-        lcoe = row["mean_lcoe"]
-        return ((fcr * cc) + om) / (lcoe * row["capacity"] * 8760)
-
 
 class Least_Cost():
     """Class to handle various elements of calculating a least cost table."""
@@ -1484,45 +2396,740 @@ class Least_Cost():
         msg = ("<reView Least_Cost object>")
         return msg
 
-    def least_cost(self, dfs, by="total_lcoe"):
-        """Return a single least cost df from a list dfs."""
-        # Make one big data frame
-        bdf = pd.concat(dfs)
-        bdf = bdf.reset_index(drop=True)
+    def least_cost(self, dfs, by="total_lcoe", top=2):
+        """Return a single least cost df from a list dfs.
 
-        # Group, find minimum, and subset
-        idx = bdf.groupby("sc_point_gid")[by].idxmin()
-        df = bdf.iloc[idx]
+        Data frames are folded in one at a time, so dfs can be any iterable
+        and only the current winning rows are held in memory. See
+        Least_Cost_Reducer for the runner-up columns added when top > 1.
+        """
+        reducer = Least_Cost_Reducer(by=by, top=top)
+        for df in dfs:
+            reducer.add(df)
+        return reducer.table()
 
-        return df
+    def calc(self, paths, dst, by="total_lcoe", top=2, progress=None,
+             workers=None):
+        """Build the single least cost table from a list of tables.
+
+        Parameters
+        ----------
+        paths : list
+            Paths to supply-curve tables.
+        dst : str
+            Path to the output least cost table.
+        by : str
+            The field to minimize.
+        top : int
+            The number of ranked scenarios to keep for each point. If more
+            than 1, runner-up scenario, value, and margin columns are added.
+        progress : callable, optional
+            A function called with the stage ("minima" or "rows"), the number
+            of tables done, and the total number of tables in that stage.
+        workers : int, optional
+            Number of processes to use. Defaults to one per core.
 
-    def calc(self, paths, dst, by="total_lcoe"):
-        """Build the single least cost table from a list of tables."""
-        # Not including an overwrite option for now
-        if not os.path.exists(dst):
-
-            # Collect all data frames - biggest lift of all
-            paths.sort()
-            dfs = []
-            with mp.Pool(10) as pool:
-                for df in tqdm(pool.imap(self.read_df, paths),
-                               total=len(paths)):
-                    dfs.append(df)
-
-            # Make one big data frame and save
-            df = self.least_cost(dfs, by=by)
-            df.to_csv(dst, index=False)
-
-    def read_df(self, path):
-        """Retrieve a single data frame."""
+        Returns
+        -------
+        str
+            Path to the least cost table.
+        """
+        return self.calc_groups({dst: paths}, by=by, top=top,
+                                progress=progress, workers=workers)[0]
+
+    def calc_groups(self, groups, by="total_lcoe", top=2, progress=None,
+                    workers=None):
+        """Build least cost tables for several groups of tables at once.
+
+        Each table is read once no matter how many groups it's in. Results
+        are cached by the content of their inputs (see Least_Cost_Cache), so
+        an existing output is only reused if it was built from the current
+        versions of the same tables with the same by field and recalc values.
+
+        Tables are read in parallel in two passes. Workers first read only
+        sc_point_gid and the by field and hand back per-gid minima through
+        shared memory, which are folded in file order. Then only the tables
+        with winning points are read again to pull out those rows.
+
+        Parameters
+        ----------
+        groups : dict
+            Output least cost table paths and the lists of supply-curve table
+            paths to build them from (e.g. one per level of a grouping
+            variable).
+        by : str
+            The field to minimize.
+        top : int
+            The number of ranked scenarios to keep for each point. If more
+            than 1, runner-up scenario, value, and margin columns are added.
+        progress : callable, optional
+            A function called with the stage ("minima" or "rows"), the number
+            of tables done, and the total number of tables in that stage.
+        workers : int, optional
+            Number of processes to use. Defaults to one per core.
+
+        Returns
+        -------
+        list
+            Paths to the least cost tables, in the order of groups.
+        """
+        recalcs = None
+        if self.recalc_table:
+            recalcs = self.recalc_table["scenario_a"]
+        if progress is None:
+            progress = self._progress
+
+        # Reuse results built from the same inputs, if there are any
+        caches = {}
+        for dst, paths in groups.items():
+            cache = Least_Cost_Cache(os.path.dirname(os.path.abspath(dst)))
+            key, details = cache.key(paths, by, recalcs, top=top)
+            if not cache.get(key, dst):
+                caches[dst] = (cache, key, details)
+        if not caches:
+            return list(groups)
+
+        # Each table is read once and folded into each of its groups
+        reducers = {}
+        for dst in caches:
+            reducers[dst] = Least_Cost_Reducer(by=by, top=top)
+        paths = sorted({p for dst in caches for p in groups[dst]})
+        members = {p: [d for d in caches if p in groups[d]] for p in paths}
+        if not workers:
+            workers = mp.cpu_count()
+        workers = max(min(workers, len(paths)), 1)
+
+        # Name each table's shared memory block up front so that any blocks
+        # left behind by a failed run can be removed, and start the resource
+        # tracker here so the workers register their blocks with it
+        token = secrets.token_hex(4)
+        blocks = [f"rvlc_{os.getpid()}_{token}_{i}" for i in range(len(paths))]
+        resource_tracker.ensure_running()
+
+        try:
+            with mp.Pool(workers) as pool:
+                # Fold per-gid minima in file order
+                args = [(p, by, blocks[i], find_scenario(p)[1])
+                        for i, p in enumerate(paths)]
+                minima = pool.imap(self._minima, args)
+                for i, (scenario, schema, size, nrows) in enumerate(minima):
+                    gids, positions, values = self._unshare(blocks[i], size)
+                    for dst in members[paths[i]]:
+                        reducers[dst].track(schema)
+                        reducers[dst].fold(gids, values, positions, scenario,
+                                           nrows)
+                    progress("minima", i + 1, len(paths))
+
+                # Pull out the winning rows of each table for each group
+                winners = {}
+                for dst, reducer in reducers.items():
+                    fpaths = sorted(p for p in paths if p in groups[dst])
+                    positions = reducer.winning_positions()
+                    for index, rpositions in positions.items():
+                        winners.setdefault(fpaths[index], []).append(
+                            (dst, index, rpositions)
+                        )
+                args = [(p, [w[2] for w in wins])
+                        for p, wins in winners.items()]
+                rows = pool.imap(self._rows, args)
+                for i, (path, frames) in enumerate(zip(winners, rows)):
+                    for (dst, index, _), frame in zip(winners[path], frames):
+                        reducers[dst].rows[index] = frame
+                    progress("rows", i + 1, len(winners))
+        finally:
+            for name in blocks:
+                self._unlink(name)
+
+        for dst, (cache, key, details) in caches.items():
+            df = reducers[dst].table()
+            tmp = f"{dst}.{os.getpid()}.tmp"
+            df.to_csv(tmp, index=False)
+            os.replace(tmp, dst)
+            cache.put(key, dst, details)
+
+        return list(groups)
+
+    def read_df(self, path, columns=None):
+        """Retrieve a single data frame.
+
+        Parameters
+        ----------
+        path : str
+            Path to a supply-curve table.
+        columns : list, optional
+            Columns to read from tables that aren't recalculated. The default
+            of None reads all of them.
+
+        Returns
+        -------
+        pd.core.frame.DataFrame
+            The table with a "scenario" column.
+        """
         _, scenario = find_scenario(path)
         if self.recalc_table:
             table = self.recalc_table["scenario_a"]
             df = Data(self.project).build(scenario, **table)
         else:
-            df = pd.read_csv(path, low_memory=False)
+            df = columnar.read_table(path, columns=columns)
         df["scenario"] = scenario
-        time.sleep(0.2)
+        return df
+
+    def _minima(self, args):
+        """Find the per-gid minima of a table and share them (worker).
+
+        The scenario name comes from the parent so that tables without rows
+        still share an empty block of minima.
+        """
+        path, by, name, scenario = args
+        if self.recalc_table:
+            df = self.read_df(path)
+            schema = df.iloc[:0]
+        else:
+            df = self.read_df(path, columns=["sc_point_gid", by])
+            schema = columnar.schema(path)
+            schema["scenario"] = df["scenario"].iloc[:0]
+        gids, positions, values = Least_Cost_Reducer.minima(
+            df["sc_point_gid"].values, df[by].values
+        )
+        self._share(name, gids, positions, values)
+        return scenario, schema, gids.size, len(df)
+
+    def _rows(self, args):
+        """Return sets of rows of a table by position (worker)."""
+        path, position_sets = args
+        df = self.read_df(path)
+        return [df.iloc[positions] for positions in position_sets]
+
+    def _progress(self, stage, done, total):
+        """Print progress of a least cost calculation."""
+        stages = {"minima": "Finding minima", "rows": "Extracting rows"}
+        print(f"{stages[stage]}: {done}/{total} tables")
+
+    @staticmethod
+    def _share(name, gids, positions, values):
+        """Copy per-gid minima into a new shared memory block.
+
+        The block is left for the parent process to read and unlink.
+        """
+        size = gids.size
+        block = shared_memory.SharedMemory(name=name, create=True,
+                                           size=max(size, 1) * 24)
+        try:
+            array = np.ndarray((3, size), dtype=np.int64, buffer=block.buf)
+            array[0] = gids
+            array[1] = positions
+            array[2] = values.view(np.int64)
+            del array
+        finally:
+            block.close()
+
+    @staticmethod
+    def _unlink(name):
+        """Remove a shared memory block if it still exists."""
+        try:
+            block = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            return
+        block.close()
+        block.unlink()
+
+    @staticmethod
+    def _unshare(name, size):
+        """Read and unlink a shared memory block of per-gid minima."""
+        block = shared_memory.SharedMemory(name=name)
+        try:
+            array = np.ndarray((3, size), dtype=np.int64, buffer=block.buf)
+            gids = array[0].copy()
+            positions = array[1].copy()
+            values = array[2].view(np.float64).copy()
+            del array
+        finally:
+            block.close()
+            block.unlink()
+        return gids, positions, values
+
+
+class Least_Cost_Cache:
+    """Content-addressed store of least cost tables.
+
+    Each table is keyed on a hash of its input files' paths, modification
+    times, and sizes, the by field, and the normalized recalc values. A json
+    manifest in the output folder maps keys to files, so the same inputs are
+    never recalculated, even under a different file name, and a file is never
+    reused after its inputs change. Once the cached tables exceed a size limit,
+    stale entries are removed first, then the least recently used ones.
+    """
+
+    def __init__(self, folder, limit=LEAST_COST_CACHE_LIMIT):
+        """Initialize Least_Cost_Cache object.
+
+        Parameters
+        ----------
+        folder : str
+            The least cost output folder (e.g. review_outputs).
+        limit : int
+            The maximum combined size of cached tables in bytes.
+        """
+        self.folder = folder
+        self.limit = limit
+        self.manifest_path = os.path.join(folder, ".least_cost_manifest.json")
+
+    def __repr__(self):
+        """Print representation string."""
+        msg = (f"<reView Least_Cost_Cache object: folder='{self.folder}', "
+               f"{len(self.manifest)} entries>")
+        return msg
+
+    @property
+    def manifest(self):
+        """Return the manifest of cached tables."""
+        try:
+            with open(self.manifest_path, "r") as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            manifest = {}
+        return manifest
+
+    def key(self, paths, by, recalcs=None, top=1):
+        """Return the cache key for a least cost table and its inputs.
+
+        Parameters
+        ----------
+        paths : list
+            Paths to the input supply-curve tables.
+        by : str
+            The field to minimize.
+        recalcs : dict, optional
+            Recalc values for fcr, capex, opex, and losses.
+        top : int
+            The number of ranked scenarios kept for each point.
+
+        Returns
+        -------
+        tuple
+            The key and a dictionary describing the inputs.
+        """
+        inputs = [columnar.fingerprint(path) for path in sorted(paths)]
+        details = {"inputs": inputs, "by": by,
+                   "recalc": self._normalize(recalcs), "top": top}
+        string = json.dumps(details, sort_keys=True)
+        key = hashlib.sha256(string.encode()).hexdigest()
+        return key, details
+
+    def get(self, key, dst):
+        """Retrieve a cached table, linking or copying it to dst if needed.
+
+        Parameters
+        ----------
+        key : str
+            A key from Least_Cost_Cache.key.
+        dst : str
+            The path the table is requested at.
+
+        Returns
+        -------
+        str | None
+            The dst path if the table is cached, None otherwise.
+        """
+        dst = os.path.abspath(dst)
+        with self._lock():
+            manifest = self.manifest
+            entry = manifest.get(key)
+            if entry is None:
+                return None
+
+            files = self._valid(entry)
+            if not files or self._stale(entry):
+                del manifest[key]
+                self._write(manifest)
+                return None
+
+            # The same table was requested under another name
+            if dst not in files:
+                tmp = f"{dst}.{os.getpid()}.tmp"
+                try:
+                    os.link(files[0], tmp)
+                except OSError:
+                    shutil.copyfile(files[0], tmp)
+                os.replace(tmp, dst)
+                self._release(manifest, dst)
+                entry["files"][dst] = self._fingerprint(dst)
+
+            entry["accessed"] = time.time()
+            self._write(manifest)
+        return dst
+
+    def put(self, key, dst, details):
+        """Add a new table to the cache and evict old entries if needed.
+
+        Parameters
+        ----------
+        key : str
+            A key from Least_Cost_Cache.key.
+        dst : str
+            Path to the new least cost table.
+        details : dict
+            The input description from Least_Cost_Cache.key.
+        """
+        dst = os.path.abspath(dst)
+        with self._lock():
+            manifest = self.manifest
+            self._release(manifest, dst)
+            now = time.time()
+            manifest[key] = {**details,
+                             "files": {dst: self._fingerprint(dst)},
+                             "size": os.path.getsize(dst), "created": now,
+                             "accessed": now}
+            self._write(self.evict(manifest, keep=key))
+
+    def evict(self, manifest, keep=None):
+        """Remove entries over the size limit, stale then least recent.
+
+        Parameters
+        ----------
+        manifest : dict
+            The manifest of cached tables.
+        keep : str, optional
+            A key to keep regardless of age.
+
+        Returns
+        -------
+        dict
+            The manifest without the evicted entries.
+        """
+        # Entries without files are dropped, stale entries go first, and the
+        # rest go from least to most recently used
+        for key in list(manifest):
+            if not self._valid(manifest[key]):
+                del manifest[key]
+        order = sorted(manifest, key=lambda k: (not self._stale(manifest[k]),
+                                                manifest[k]["accessed"]))
+
+        total = sum(entry["size"] for entry in manifest.values())
+        for key in order:
+            entry = manifest[key]
+            if key == keep:
+                continue
+            if total <= self.limit:
+                break
+            for path in self._valid(entry):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= entry["size"]
+            del manifest[key]
+
+        return manifest
+
+    def _fingerprint(self, path):
+        """Return the modification time and size of a cached file."""
+        fprint = columnar.fingerprint(path)
+        return [fprint["mtime"], fprint["size"]]
+
+    def _lock(self):
+        """Return a lock on the manifest across threads and processes."""
+        return Flight(("least_cost_manifest", self.manifest_path))
+
+    def _normalize(self, recalcs):
+        """Return recalc values as floats in consistent units."""
+        if not recalcs:
+            return None
+        normalized = {}
+        for key in ["fcr", "capex", "opex", "losses"]:
+            value = recalcs.get(key)
+            if value is None or value == "":
+                continue
+            if isinstance(value, str):
+                value = value.replace(",", "").replace("$", "")
+                value = value.replace("%", "")
+            value = float(value)
+            if key in ["fcr", "losses"] and value > 1:
+                value = value / 100
+            normalized[key] = value
+        return normalized or None
+
+    def _release(self, manifest, path):
+        """Remove a file from every entry, since it now holds another table."""
+        for entry in manifest.values():
+            entry["files"].pop(path, None)
+
+    def _stale(self, entry):
+        """Check whether any of an entry's inputs have changed."""
+        for fprint in entry["inputs"]:
+            try:
+                if columnar.fingerprint(fprint["path"]) != fprint:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def _valid(self, entry):
+        """Return an entry's files that haven't changed since caching."""
+        files = []
+        for path, fprint in entry["files"].items():
+            try:
+                if self._fingerprint(path) == fprint:
+                    files.append(path)
+            except OSError:
+                pass
+        return files
+
+    def _write(self, manifest):
+        """Write the manifest."""
+        tmp = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as file:
+            json.dump(manifest, file, indent=4)
+        os.replace(tmp, self.manifest_path)
+
+
+class Least_Cost_Reducer:
+    """Fold supply-curve tables into a running least cost table.
+
+    For each sc_point_gid this keeps the minimum value of a field, the
+    scenario it came from, and its row, so scenarios can be added one at a
+    time without concatenating them all. The result matches grouping all
+    tables together and taking the first minimum of each group: ties go to
+    the earlier table and NaNs only win if a point has no other values.
+
+    The best values and scenarios of the top few scenarios at each point are
+    kept in the same pass (one column per rank in the values and winners
+    arrays), which adds runner-up and margin columns to the table.
+    """
+
+    def __init__(self, by="total_lcoe", top=2):
+        """Initialize Least_Cost_Reducer object.
+
+        Parameters
+        ----------
+        by : str
+            The field to minimize.
+        top : int
+            The number of ranked scenarios to keep for each point. Runner-up
+            columns are only added to the table if this is more than 1.
+        """
+        self.by = by
+        self.top = top
+        self.gids = np.array([], dtype=np.int64)
+        self.values = np.empty((0, top), dtype=np.float64)
+        self.winners = np.empty((0, top), dtype=np.int64)
+        self.positions = np.array([], dtype=np.int64)
+        self.scenarios = []
+        self.offsets = []
+        self.nrows = 0
+        self.rows = {}
+        self._columns = {}
+        self._missing = set()
+
+    def __repr__(self):
+        """Print representation string."""
+        msg = (f"<reView Least_Cost_Reducer object: by='{self.by}', "
+               f"{len(self.scenarios)} tables, {self.gids.size} points>")
+        return msg
+
+    @staticmethod
+    def minima(gids, values):
+        """Return the first minimum value and its position for each gid.
+
+        Parameters
+        ----------
+        gids : np.ndarray
+            The sc_point_gid of each row in a table.
+        values : np.ndarray
+            The values to minimize for each row in a table.
+
+        Returns
+        -------
+        tuple
+            Arrays of the unique (sorted) gids, the row positions of their
+            minima, and the minimum values. Gids with only NaN values return
+            their first row and NaN.
+        """
+        gids = np.asarray(gids, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        positions = np.arange(gids.size)
+        keep = ~np.isnan(gids)
+        gids, values, positions = gids[keep], values[keep], positions[keep]
+
+        # Sort by gid, then non-NaNs first, then value, then position
+        order = np.lexsort((positions, values, np.isnan(values), gids))
+        gids = gids[order]
+        first = np.ones(gids.size, dtype=bool)
+        first[1:] = gids[1:] != gids[:-1]
+        order = order[first]
+
+        return (gids[first].astype(np.int64), positions[order],
+                values[order])
+
+    def add(self, df, scenario=None):
+        """Fold a table into the least cost table.
+
+        Parameters
+        ----------
+        df : pd.core.frame.DataFrame
+            A supply-curve table with sc_point_gid and the by field.
+        scenario : str, optional
+            The table's scenario name. Defaults to its "scenario" column, or
+            its order of addition if there isn't one.
+
+        Returns
+        -------
+        int
+            The number of points this table is now the least cost for.
+        """
+        if scenario is None:
+            if "scenario" in df.columns and df.shape[0] > 0:
+                scenario = df["scenario"].iloc[0]
+            else:
+                scenario = len(self.scenarios)
+
+        self.track(df)
+        gids, positions, values = self.minima(df["sc_point_gid"].values,
+                                              df[self.by].values)
+        won = self.fold(gids, values, positions, scenario, len(df))
+
+        # Store this table's winning rows and drop those it replaced
+        index = len(self.scenarios) - 1
+        for key in list(self.rows):
+            rows = self.rows[key]
+            idx = np.searchsorted(self.gids, rows["sc_point_gid"])
+            keep = self.winners[idx, 0] == key
+            if not keep.all():
+                self.rows[key] = rows[keep]
+        if won.any():
+            self.rows[index] = df.iloc[positions[won]]
+
+        return int(won.sum())
+
+    def fold(self, gids, values, positions, scenario, nrows):
+        """Fold a table's per-gid minima into the running minima.
+
+        Parameters
+        ----------
+        gids : np.ndarray
+            Unique gids from Least_Cost_Reducer.minima.
+        values : np.ndarray
+            Minimum values for each gid.
+        positions : np.ndarray
+            Row positions of the minima in their table.
+        scenario : str
+            The table's scenario name.
+        nrows : int
+            The number of rows in the table.
+
+        Returns
+        -------
+        np.ndarray
+            A boolean array marking the gids this table now wins.
+        """
+        # Add new points
+        new = np.setdiff1d(gids, self.gids, assume_unique=True)
+        if new.size:
+            allgids = np.union1d(self.gids, new)
+            idx = np.searchsorted(allgids, self.gids)
+            for attr, fill in [("values", np.nan), ("winners", -1),
+                               ("positions", -1)]:
+                array = getattr(self, attr)
+                shape = (allgids.size, *array.shape[1:])
+                expanded = np.full(shape, fill, dtype=array.dtype)
+                expanded[idx] = array
+                setattr(self, attr, expanded)
+            self.gids = allgids
+
+        # Rank the kept scenarios and this one at each point: claimed ranks
+        # first, then non-NaNs, then values, then order of addition
+        index = len(self.scenarios)
+        idx = np.searchsorted(self.gids, gids)
+        ranked_values = np.column_stack([self.values[idx], values])
+        ranked_winners = np.column_stack([self.winners[idx],
+                                          np.full(idx.size, index)])
+        nans = np.isnan(ranked_values)
+        order = np.lexsort((np.broadcast_to(np.arange(self.top + 1),
+                                            nans.shape),
+                            np.where(nans, 0, ranked_values), nans,
+                            ranked_winners == -1), axis=-1)[:, :self.top]
+        self.values[idx] = np.take_along_axis(ranked_values, order, axis=1)
+        self.winners[idx] = np.take_along_axis(ranked_winners, order, axis=1)
+
+        won = self.winners[idx, 0] == index
+        self.positions[idx[won]] = positions[won]
+
+        self.scenarios.append(scenario)
+        self.offsets.append(self.nrows)
+        self.nrows += nrows
+
+        return won
+
+    def track(self, df):
+        """Add a table's columns to the combined columns.
+
+        Call this once per table, before folding it, when using fold
+        directly. Tables without rows are enough.
+        """
+        for column in self._columns:
+            if column not in df.columns:
+                self._missing.add(column)
+        for column in df.columns:
+            if column not in self._columns:
+                if self.scenarios:
+                    self._missing.add(column)
+                self._columns[column] = df[column].dtype
+
+    def winning_positions(self):
+        """Return the row positions of the winning rows in each table.
+
+        Returns
+        -------
+        dict
+            Table indices (in the order they were folded) and arrays of
+            their winning rows' positions. The rows at these positions can
+            be assigned to the rows attribute under the same index to build
+            the table.
+        """
+        positions = {}
+        winners = self.winners[:, 0]
+        for index in np.unique(winners[winners > -1]):
+            positions[int(index)] = self.positions[winners == index]
+        return positions
+
+    def table(self):
+        """Return the least cost table, ordered by sc_point_gid.
+
+        The index holds each row's position in the combined tables. If more
+        than one scenario is ranked, runner_up_scenario, runner_up_{by}, and
+        {by}_margin (runner-up minus least cost value) columns are added.
+        """
+        dfs = []
+        for key, rows in self.rows.items():
+            rows = rows.copy()
+            idx = np.searchsorted(self.gids, rows["sc_point_gid"])
+            rows.index = self.offsets[key] + self.positions[idx]
+            dfs.append(rows)
+
+        columns = list(self._columns)
+        if not dfs:
+            return pd.DataFrame(columns=columns)
+        df = pd.concat(dfs).reindex(columns=columns)
+        df = df.sort_values("sc_point_gid", kind="stable")
+
+        # Columns missing from some tables would have been filled with NaN
+        for column in self._missing:
+            kind = df[column].dtype.kind
+            if kind in "iu":
+                df[column] = df[column].astype(np.float64)
+            elif kind == "b":
+                df[column] = df[column].astype(object)
+
+        # The second best scenario and how much more it costs
+        if self.top > 1:
+            idx = np.searchsorted(self.gids, df["sc_point_gid"])
+            runners = self.winners[idx, 1]
+            # Points with a single scenario index -1, the NaN at the end
+            scenarios = np.array(self.scenarios + [np.nan], dtype=object)
+            df["runner_up_scenario"] = scenarios[runners]
+            df[f"runner_up_{self.by}"] = self.values[idx, 1]
+            df[f"{self.by}_margin"] = self.values[idx, 1] - self.values[idx, 0]
+
         return df
 
 
@@ -1935,3 +3542,120 @@ class Plots(Config):
                     cols[idx[1]] = col + "_2"
             df.columns = cols
         return df
+
+
+class Threshold_Index:
+    """Sorted field indexes and gid bitmaps for one supply-curve table.
+
+    Each threshold field is argsorted once, after which finding the rows
+    under a threshold is a binary search and masking one table with another
+    is a lookup into a bitmap of sc_point_gids.
+    """
+
+    def __init__(self, df, fields=None):
+        """Initialize Threshold_Index object.
+
+        Parameters
+        ----------
+        df : pd.core.frame.DataFrame
+            A supply-curve table with an sc_point_gid column.
+        fields : list, optional
+            The numeric fields to index. The default of None indexes the
+            THRESHOLD_FIELDS in df.
+        """
+        if fields is None:
+            fields = [f for f in THRESHOLD_FIELDS if f in df.columns]
+        gids = df["sc_point_gid"].values
+        if gids.dtype.kind == "f":
+            gids = np.where(np.isnan(gids), -1, gids)
+        self.gids = gids.astype(np.int64)
+        self.size = len(df)
+        self.orders = {}
+        self.values = {}
+        for field in fields:
+            self.sort(field, df[field].values)
+
+    def __repr__(self):
+        """Return representation string for Threshold_Index object."""
+        fields = ", ".join(self.orders)
+        return f"<Threshold_Index: {self.size} rows, fields=[{fields}]>"
+
+    def below(self, field, threshold, inclusive=False):
+        """Return a row mask of the values under a threshold.
+
+        Parameters
+        ----------
+        field : str
+            An indexed field.
+        threshold : int | float
+            The threshold value.
+        inclusive : bool
+            Include values equal to the threshold.
+
+        Returns
+        -------
+        np.ndarray
+            A boolean array that is True for each row with a value under (or
+            at) the threshold. Missing values are never under it.
+        """
+        side = "right" if inclusive else "left"
+        n = np.searchsorted(self.values[field], threshold, side=side)
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.orders[field][:n]] = True
+        return mask
+
+    def bitmap(self, mask=None):
+        """Return a bitmap of the gids in a set of rows.
+
+        Parameters
+        ----------
+        mask : np.ndarray, optional
+            A boolean row mask. The default of None uses all rows.
+
+        Returns
+        -------
+        np.ndarray
+            A boolean array indexed by sc_point_gid.
+        """
+        gids = self.gids
+        if mask is not None:
+            gids = gids[mask]
+        gids = gids[gids > -1]
+        size = gids.max() + 1 if gids.size else 0
+        bitmap = np.zeros(size, dtype=bool)
+        bitmap[gids] = True
+        return bitmap
+
+    def contains(self, bitmap):
+        """Return a row mask of the rows with a gid in a bitmap.
+
+        Parameters
+        ----------
+        bitmap : np.ndarray
+            A boolean array indexed by sc_point_gid, from bitmap.
+
+        Returns
+        -------
+        np.ndarray
+            A boolean array that is True for each row whose gid is set.
+        """
+        gids = self.gids
+        inside = (gids > -1) & (gids < bitmap.size)
+        mask = np.zeros(self.size, dtype=bool)
+        mask[inside] = bitmap[gids[inside]]
+        return mask
+
+    def sort(self, field, values):
+        """Build the sorted index of a field.
+
+        Parameters
+        ----------
+        field : str
+            The name of the field.
+        values : np.ndarray
+            The numeric values of the field, one per row.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        order = np.argsort(values, kind="stable")
+        self.orders[field] = order
+        self.values[field] = values[order]
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Check the table pool's serializers, budgets, and invalidation.
+
+Created on Sun Oct 18 22:31:08 2026
+
+@author: twillia2
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from review.caching import SERIALIZERS, TablePool
+
+
+def make_frame(n=5000, offset=0):
+    """Return a table with floats, integers, and repeated strings."""
+    rng = np.random.default_rng(offset)
+    df = pd.DataFrame({
+        "sc_point_gid": np.arange(n) + offset,
+        "total_lcoe": rng.uniform(20, 80, n),
+        "state": rng.choice(["Colorado", "Utah", "Wyoming"], n),
+        "county": [f"county_{i}" for i in range(n)]
+    })
+    df.loc[::7, "total_lcoe"] = np.nan
+    return df
+
+
+@pytest.mark.parametrize("table_format", list(SERIALIZERS))
+def test_round_trip(tmp_path, table_format):
+    """Test that every format returns what was set from a new process."""
+    df = make_frame()
+    value = {"table": df, "n": 3}
+    pool = TablePool(str(tmp_path), threshold=0, table_format=table_format)
+    assert pool.set("frame", df)
+    assert pool.set("dict", value)
+    assert pool.set("list", [1, "a"])
+
+    # A new pool has nothing in memory, like another worker
+    pool = TablePool(str(tmp_path), threshold=0, table_format=table_format)
+    pd.testing.assert_frame_equal(pool.get("frame"), df)
+    pd.testing.assert_frame_equal(pool.get("dict")["table"], df)
+    assert pool.get("dict")["n"] == 3
+    assert pool.get("list") == [1, "a"]
+
+
+def test_dictionary_decoding(tmp_path):
+    """Test that dictionary encoded strings come back as plain strings."""
+    df = make_frame()
+    pool = TablePool(str(tmp_path), threshold=0, table_format="arrow_lz4")
+    pool.set("frame", df)
+    pool = TablePool(str(tmp_path), threshold=0, table_format="arrow_lz4")
+    out = pool.get("frame")
+    assert not isinstance(out["state"].dtype, pd.CategoricalDtype)
+    assert out["state"].dtype == df["state"].dtype
+    assert out["state"].tolist() == df["state"].tolist()
+
+
+def test_memory_budget(tmp_path):
+    """Test that each process keeps only the most recently used entries."""
+    frames = [make_frame(offset=i) for i in range(4)]
+    size = int(frames[0].memory_usage(index=True, deep=True).sum())
+    pool = TablePool(str(tmp_path), threshold=0, memory_limit=int(2.5 * size))
+    for i, df in enumerate(frames):
+        pool.set(f"frame_{i}", df)
+
+    stats = pool.stats()
+    assert stats["memory_entries"] == 2
+    assert stats["memory_bytes"] <= pool.memory_limit
+    assert stats["counters"]["memory_evictions"] == 2
+
+    # Evicted entries are read back from disk
+    pd.testing.assert_frame_equal(pool.get("frame_0"), frames[0])
+    assert pool.stats()["counters"]["memory_hits"] == 0
+    pool.get("frame_3")
+    assert pool.stats()["counters"]["memory_hits"] == 1
+
+
+def test_disk_budget(tmp_path):
+    """Test that the cache folder is pruned to the disk budget."""
+    pool = TablePool(str(tmp_path), threshold=0)
+    pool.set("frame", make_frame())
+    size = pool.entry_size("frame")
+    pool.clear()
+
+    pool = TablePool(str(tmp_path), threshold=0, disk_limit=3 * size)
+    for i in range(10):
+        pool.set(f"frame_{i}", make_frame(offset=i))
+
+    # Pruning happens before each set, so the last one may go over by
+    # about one entry
+    stats = pool.stats()
+    assert stats["disk_bytes"] <= 1.1 * (pool.disk_limit + size)
+    assert stats["counters"]["disk_evictions"] > 0
+    assert pool.get("frame_9") is not None
+    assert pool.get("frame_0") is None
+
+
+def test_signature_invalidation(tmp_path):
+    """Test that an entry rewritten by another process is read again."""
+    writer = TablePool(str(tmp_path), threshold=0)
+    reader = TablePool(str(tmp_path), threshold=0, memory_limit=2 ** 30)
+
+    first = make_frame(offset=0)
+    writer.set("frame", first)
+    pd.testing.assert_frame_equal(reader.get("frame"), first)
+    pd.testing.assert_frame_equal(reader.get("frame"), first)
+    assert reader.stats()["counters"]["memory_hits"] == 1
+
+    second = make_frame(offset=1)
+    writer.set("frame", second)
+    pd.testing.assert_frame_equal(reader.get("frame"), second)
+
+    writer.delete("frame")
+    assert reader.get("frame") is None
+    assert reader.stats()["memory_entries"] == 0
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Check how the warmer records requested signals.
+
+Created on Sun Oct 18 22:48:51 2026
+
+@author: twillia2
+"""
+import json
+import os
+import sys
+import time
+
+import pytest
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                   "app")
+sys.path.insert(0, APP)
+
+import warmer  # noqa: E402
+
+
+@pytest.fixture
+def pending(monkeypatch):
+    """Start with no pending counts and no automatic flushes."""
+    monkeypatch.setattr(warmer, "_PENDING", {})
+    monkeypatch.setattr(warmer, "_FLUSHED", {})
+    monkeypatch.setattr(warmer, "FLUSH_INTERVAL", 3600)
+    return warmer._PENDING
+
+
+def record(signal, times, path):
+    """Record a signal a number of times without flushing."""
+    warmer._FLUSHED[path] = time.time()
+    for _ in range(times):
+        warmer.record_signal(signal, path=path)
+
+
+def test_record_signal(tmp_path, pending):
+    """Test that counts are added to the file, without fingerprints."""
+    path = str(tmp_path / "popular.json")
+    record({"path": "a.csv", "fingerprints": ["x"]}, 2, path)
+    record({"path": "a.csv", "fingerprints": ["y"]}, 1, path)
+    record({"path": "b.csv"}, 1, path)
+    warmer.flush_signals()
+    assert not pending
+
+    record({"path": "b.csv"}, 1, path)
+    warmer.flush_signals()
+    assert warmer.popular_signals(path=path) == [
+        ("map", {"path": "a.csv"}),
+        ("map", {"path": "b.csv"})
+    ]
+    assert sorted(warmer.read_counts(path).values()) == [2, 3]
+
+
+def test_record_signal_halving(tmp_path, pending, monkeypatch):
+    """Test that counts are halved, and ones dropped, past the limit."""
+    monkeypatch.setattr(warmer, "POPULAR_LIMIT", 10)
+    path = str(tmp_path / "popular.json")
+    record({"path": "a.csv"}, 8, path)
+    record({"path": "b.csv"}, 1, path)
+    warmer.flush_signals()
+    assert sorted(warmer.read_counts(path).values()) == [1, 8]
+
+    record({"path": "c.csv"}, 3, path)
+    warmer.flush_signals()
+    counts = warmer.read_counts(path)
+    a = json.dumps(["map", {"path": "a.csv"}])
+    c = json.dumps(["map", {"path": "c.csv"}])
+    assert counts == {a: 4, c: 1}
+
+
+def test_failed_flush(tmp_path, pending):
+    """Test that counts that can't be written are kept for the next flush."""
+    blocker = tmp_path / "blocker"
+    blocker.write_text("")
+    path = str(blocker / "popular.json")
+    record({"path": "a.csv"}, 2, path)
+    warmer.flush_signals()
+    assert sum(pending[path].values()) == 2
+
+    record({"path": "a.csv"}, 1, path)
+    warmer.flush_signals()
+    assert sum(pending[path].values()) == 3
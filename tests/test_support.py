@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""Check the array versions of the support calculations against the table
+operations they replaced.
+
+Created on Sun Oct 18 22:05:37 2026
+
+@author: twillia2
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from review.support import (Difference, Filter_Pipeline, Least_Cost_Reducer,
+                            Threshold_Index, lcoe_kernel)
+
+
+OVALUES = {"fcr": 0.072, "capex": 1300, "opex": 40, "losses": 0.167}
+
+
+def make_table(seed, n=400):
+    """Return a random supply-curve table."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "sc_point_gid": rng.permutation(2 * n)[:n],
+        "capacity": rng.uniform(10, 200, n),
+        "mean_cf": rng.uniform(0.2, 0.5, n).round(3),
+        "mean_lcoe": rng.uniform(20, 80, n),
+        "trans_cap_cost": rng.uniform(1000, 50000, n),
+        "state": rng.choice(["Colorado", "Utah", "Wyoming"], n),
+        "offshore": rng.integers(0, 2, n)
+    })
+    df["total_lcoe"] = df["mean_lcoe"] + rng.uniform(0, 10, n).round(0)
+    df["total_lcoe_threshold"] = df["total_lcoe"]
+    df["mean_lcoe_threshold"] = df["mean_lcoe"]
+    df.loc[::37, "total_lcoe_threshold"] = np.nan
+    return df
+
+
+def old_lcoe(df, ovalues, nvalues):
+    """Recalculate LCOE figures with the original table formulas."""
+    capacity = df["capacity"].values
+    capacity_kw = capacity * 1000
+    mean_lcoe = df["mean_lcoe"].values
+    trans_cap_cost = df["trans_cap_cost"].values
+
+    def adjust(cf):
+        if nvalues["losses"] != ovalues["losses"]:
+            gross_cf = cf / (1 - ovalues["losses"])
+            cf = gross_cf - (gross_cf * nvalues["losses"])
+        return cf
+
+    cc = ovalues["capex"] * capacity_kw
+    om = ovalues["opex"] * capacity_kw
+    cf = ((ovalues["fcr"] * cc) + om) / (mean_lcoe * capacity * 8760)
+    cf = adjust(cf)
+    mean_cf = adjust(df["mean_cf"].values)
+
+    cc = nvalues["capex"] * capacity_kw
+    om = nvalues["opex"] * capacity_kw
+    lcoe = ((nvalues["fcr"] * cc) + om) / (capacity * cf * 8760)
+    cc = trans_cap_cost * capacity
+    lcot = (cc * nvalues["fcr"]) / (capacity * mean_cf * 8760)
+    return {"mean_cf": mean_cf, "mean_lcoe": lcoe, "lcot": lcot,
+            "total_lcoe": lcoe + lcot}
+
+
+def old_least_cost(dfs, by="total_lcoe"):
+    """Return the least cost rows of a list of tables the original way."""
+    bdf = pd.concat(dfs).reset_index(drop=True)
+    idx = bdf.groupby("sc_point_gid")[by].idxmin()
+    return bdf.iloc[idx].sort_values("sc_point_gid")
+
+
+@pytest.mark.parametrize("nvalues", [
+    OVALUES,
+    {"fcr": 0.05, "capex": 1100, "opex": 35, "losses": 0.167},
+    {"fcr": 0.08, "capex": 1500, "opex": 45, "losses": 0.1}
+])
+def test_lcoe_kernel(nvalues):
+    """Test that the LCOE kernel matches the original formulas."""
+    df = make_table(0)
+    values = lcoe_kernel(df["capacity"].values, df["mean_cf"].values,
+                         df["mean_lcoe"].values, df["trans_cap_cost"].values,
+                         OVALUES, nvalues)
+    expected = old_lcoe(df, OVALUES, nvalues)
+    for key, array in expected.items():
+        np.testing.assert_allclose(values[key], array, rtol=1e-12)
+
+
+def test_lcoe_kernel_sweep():
+    """Test that column arrays of parameters give one row per combination."""
+    df = make_table(1)
+    combos = [{"fcr": 0.05, "capex": 1100, "opex": 35, "losses": 0.167},
+              {"fcr": 0.08, "capex": 1500, "opex": 45, "losses": 0.1}]
+    nvalues = {k: np.array([[c[k]] for c in combos]) for k in OVALUES}
+    values = lcoe_kernel(df["capacity"].values, df["mean_cf"].values,
+                         df["mean_lcoe"].values, df["trans_cap_cost"].values,
+                         OVALUES, nvalues)
+    for i, combo in enumerate(combos):
+        expected = old_lcoe(df, OVALUES, combo)
+        for key, array in expected.items():
+            np.testing.assert_allclose(values[key][i], array, rtol=1e-12)
+
+
+def test_least_cost_reducer():
+    """Test that folding tables matches the first minimum of each point."""
+    dfs = []
+    for i in range(3):
+        df = make_table(10 + i)
+        df["scenario"] = f"scenario_{i}"
+        dfs.append(df)
+
+    # A point tied across all tables and a point missing one value
+    tie, missing = 10000, 10001
+    for df in dfs:
+        df.loc[0, ["sc_point_gid", "total_lcoe"]] = [tie, 50]
+        df.loc[1, ["sc_point_gid", "total_lcoe"]] = [missing, 60]
+    dfs[1].loc[1, "total_lcoe"] = np.nan
+
+    reducer = Least_Cost_Reducer(top=1)
+    for df in dfs:
+        reducer.add(df)
+    table = reducer.table()
+
+    expected = old_least_cost(dfs)
+    columns = ["sc_point_gid", "scenario", "total_lcoe"]
+    pd.testing.assert_frame_equal(table[columns].reset_index(drop=True),
+                                  expected[columns].reset_index(drop=True))
+    scenarios = table.set_index("sc_point_gid")["scenario"]
+    assert scenarios[tie] == "scenario_0"
+    assert scenarios[missing] == "scenario_0"
+
+
+def test_least_cost_runner_up():
+    """Test that the runner-up columns hold each point's second best."""
+    dfs = []
+    for i in range(4):
+        df = make_table(20 + i)
+        df["scenario"] = f"scenario_{i}"
+        dfs.append(df)
+
+    reducer = Least_Cost_Reducer(top=2)
+    for df in dfs:
+        reducer.add(df)
+    table = reducer.table().set_index("sc_point_gid")
+
+    # Rank every point's values, breaking ties by order of addition
+    bdf = pd.concat(dfs, ignore_index=True)
+    bdf = bdf.sort_values(["sc_point_gid", "total_lcoe"], kind="stable")
+    ranks = bdf.groupby("sc_point_gid").cumcount()
+    best = bdf[ranks == 0].set_index("sc_point_gid")
+    second = bdf[ranks == 1].set_index("sc_point_gid")
+    second = second.reindex(best.index)
+
+    assert (table["scenario"] == best["scenario"]).all()
+    pd.testing.assert_series_equal(table["runner_up_scenario"],
+                                   second["scenario"], check_names=False)
+    np.testing.assert_allclose(table["runner_up_total_lcoe"],
+                               second["total_lcoe"])
+    np.testing.assert_allclose(table["total_lcoe_margin"],
+                               second["total_lcoe"] - best["total_lcoe"])
+
+
+@pytest.mark.parametrize("units", ["$", "%"])
+def test_difference(units):
+    """Test that the vectorized difference matches the grouped version."""
+    df1 = make_table(30)
+    df2 = make_table(31)
+    field = "total_lcoe"
+
+    calculator = Difference(units)
+    ndf = calculator.calc(df1, df2, field)
+
+    df = pd.concat([df1, df2])
+    diffs = df.groupby("sc_point_gid")[field].apply(calculator.diff)
+    expected = df1.copy()
+    expected.index = df1["sc_point_gid"]
+    del expected[field]
+    expected = expected.merge(diffs.to_frame(), left_index=True,
+                              right_index=True)
+
+    pd.testing.assert_frame_equal(ndf, expected)
+
+
+def test_difference_keyed():
+    """Test that a keyed index is reused only for the same key."""
+    df1 = make_table(32)
+    df2 = make_table(33)
+    calculator = Difference("$")
+    first = calculator.calc(df1, df2, "total_lcoe", key=("a", "b"))
+    again = calculator.calc(df1, df2, "total_lcoe", key=("a", "b"))
+    pd.testing.assert_frame_equal(first, again)
+
+    df3 = make_table(34)
+    other = calculator.calc(df1, df3, "total_lcoe", key=("a", "c"))
+    expected = calculator.calc(df1, df3, "total_lcoe")
+    pd.testing.assert_frame_equal(other, expected)
+
+
+@pytest.mark.parametrize("field", ["total_lcoe_threshold",
+                                   "mean_lcoe_threshold"])
+def test_threshold_index(field):
+    """Test that indexed thresholds match comparing the values."""
+    df = make_table(40)
+    index = Threshold_Index(df)
+    for threshold in [0, 30, 50.5, 75, 1000]:
+        under = (df[field] < threshold).values
+        assert (index.below(field, threshold) == under).all()
+        at = (df[field] <= threshold).values
+        assert (index.below(field, threshold, inclusive=True) == at).all()
+
+
+def test_filter_pipeline():
+    """Test that combined pipeline masks match the original row filters."""
+    df1 = make_table(50)
+    df2 = make_table(51)
+    field = "total_lcoe_threshold"
+    states = ["Utah", "onshore"]
+    gids = df1["sc_point_gid"].values[::3].tolist()
+
+    # The original filters, one after another
+    tidx = df2["sc_point_gid"][df2[field] <= 50].values
+    df = df1[~df1["sc_point_gid"].isin(tidx)]
+    df = df[df[field] < 60]
+    df = df[df["state"].isin(states)]
+    df = df[df["offshore"] == 0]
+    expected = df[df["sc_point_gid"].isin(gids)]
+
+    pipeline = Filter_Pipeline(df1)
+    keep = pipeline.combine(pipeline.mask(Threshold_Index(df2), field, 50),
+                            pipeline.threshold(field, 60),
+                            pipeline.states(states),
+                            pipeline.gids(gids))
+    pd.testing.assert_frame_equal(pipeline.apply(keep), expected)
+
+    # Kept masks are reused
+    assert pipeline.states(states) is pipeline.states(states)
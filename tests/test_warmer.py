@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Check that the cache warmer fills the entries the scenario page reads.
+
+These need the app's dependencies and a review config with the default
+project, and are skipped otherwise.
+
+Created on Sun Oct 18 21:40:12 2026
+
+@author: twillia2
+"""
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("dash")
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                   "app")
+sys.path.insert(0, APP)
+
+
+@pytest.fixture(scope="module")
+def page():
+    """Return the scenario page module."""
+    try:
+        import scenario_page
+    except Exception as error:
+        pytest.skip(f"Could not load the scenario page: {error}")
+    return scenario_page
+
+
+@pytest.fixture(scope="module")
+def initial_signal(page):
+    """Return the signal retrieve_signal sends when the page loads."""
+    from layouts import scenario_layout
+    from warmer import layout_values
+
+    values = layout_values(scenario_layout(page.DEFAULTS))
+    signal = page.build_signal(
+        values["state_options"], values["chart_options"],
+        values["chart_xvariable_options"], values["chart_scenarios"],
+        values["recalc_table"], values["project"],
+        values["upper_lcoe_threshold"], values["threshold_field"],
+        values["scenario_a"], values["scenario_b"], values["variable"],
+        values["difference"], values["threshold_mask"],
+        values["recalc_tab"], values["difference_units"]
+    )
+    return json.loads(json.dumps(signal))
+
+
+def test_default_signal(page, initial_signal):
+    """Test that the warmer builds the page's initial signal."""
+    from warmer import default_signal
+
+    signal = default_signal(page.DEFAULTS)
+    assert signal == initial_signal
+    assert os.path.isfile(signal["path"])
+
+
+def test_warmed_keys(page, initial_signal):
+    """Test that warming fills the entries make_map and make_chart read."""
+    from app import server
+    from warmer import Warmer
+
+    warmer = Warmer(server, defaults=[page.DEFAULTS], path=os.devnull)
+    for job in warmer.jobs:
+        assert warmer._warm(job)
+
+    map_signal = page.data_signal(initial_signal)
+    function = page.cache_map_data
+    key = function.make_cache_key(function.uncached, map_signal)
+    assert page.cache2.cache.has(key)
+
+    chart_signal = page.data_signal(initial_signal, chart=True)
+    function = page.cache_chart_tables
+    key = function.make_cache_key(function.uncached, chart_signal,
+                                  "national", None)
+    assert page.cache3.cache.has(key)